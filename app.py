@@ -1,23 +1,48 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import (
+    Flask, render_template, request, redirect, url_for, flash, jsonify, make_response, stream_with_context,
+    abort, g, has_request_context, before_render_template, template_rendered, appcontext_pushed
+)
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField, TextAreaField
 from wtforms.validators import DataRequired
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_talisman import Talisman
-from datetime import datetime
-from markdown.extensions.fenced_code import FencedCodeExtension
-from markdown.extensions.tables import TableExtension
-from markdown.extensions.codehilite import CodeHiliteExtension
-from markdown import markdown
-from bleach import clean, linkify
+from datetime import datetime, timedelta, timezone
 import html
 from markupsafe import escape, Markup
+import atexit
+import bisect
+import gzip
+import hashlib
+import hmac
+import mimetypes
+import math
 import os
+import re
+import click
 from dotenv import load_dotenv
+import fcntl
 import json
-from werkzeug.utils import secure_filename
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict, namedtuple
+from email.utils import format_datetime
+from xml.sax.saxutils import escape as xml_escape
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
+import sqlite3
+
+try:
+    import brotli
+except ImportError:  # br is optional; responses fall back to gzip
+    brotli = None
 
 # Load environment variables
 load_dotenv()
@@ -31,22 +56,148 @@ is_dev = os.getenv('FLASK_ENV', 'development') == 'development'
 app = Flask(__name__, static_url_path='/static', static_folder='static')
 
 # Configure Flask app
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///blog.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///blog.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Applied to every new SQLite connection
+app.config['SQLITE_PRAGMAS'] = {
+    'journal_mode': 'WAL',  # readers no longer wait for autosave writes
+    'synchronous': 'NORMAL',  # durable with WAL, fsyncs only at checkpoints
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'cache_size': -int(os.getenv('SQLITE_CACHE_SIZE_KB', 65536)),  # negative means KiB
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 268435456)),
+    'temp_store': 'MEMORY',
+}
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+app.config['POSTS_PER_PAGE'] = int(os.getenv('POSTS_PER_PAGE', 20))
+# Request bodies above this are rejected with 413 before they are read
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', 10)) * 1024 * 1024
+# Thumbnail and content widths of the resized copies made of each upload; 0 workers resizes inline
+app.config['UPLOAD_VARIANT_WIDTHS'] = (320, 1200)
+app.config['UPLOAD_VARIANT_WORKERS'] = int(os.getenv('UPLOAD_VARIANT_WORKERS', 2))
+# Autosaves are coalesced in memory and written at most once per this many seconds per user
+app.config['DRAFT_FLUSH_INTERVAL'] = float(os.getenv('DRAFT_FLUSH_INTERVAL', 10))
+# Seconds a worker may serve a cached sidebar after another process changed it
+app.config['CATEGORY_CACHE_TTL'] = int(os.getenv('CATEGORY_CACHE_TTL', 60))
+app.config['BLOG_TITLE'] = os.getenv('BLOG_TITLE', 'My Blog')
+# Number of posts in each feed, and seconds a worker may serve a cached feed
+app.config['FEED_SIZE'] = int(os.getenv('FEED_SIZE', 20))
+app.config['FEED_CACHE_TTL'] = int(os.getenv('FEED_CACHE_TTL', 300))
+# Most feeds (format, category and site) kept in memory; the least recently used are dropped
+app.config['FEED_CACHE_ENTRIES'] = int(os.getenv('FEED_CACHE_ENTRIES', 256))
+# Scheme and host used for absolute links in feeds, e.g. https://blog.example.com.
+# Unset, links follow the request's Host header and feeds are cached per host
+app.config['SITE_URL'] = os.getenv('SITE_URL')
+# Responses smaller than this are sent uncompressed; compressed bodies of
+# responses with an ETag are kept in an LRU of this many entries
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 500))
+app.config['COMPRESS_CACHE_SIZE'] = int(os.getenv('COMPRESS_CACHE_SIZE', 256))
+# Opt-in instrumentation: /metrics is served to logged-in users or with
+# `Authorization: Bearer <METRICS_TOKEN>`, and requests slower than
+# SLOW_REQUEST_MS are logged with their SQL breakdown
+app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'False').lower() == 'true'
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+app.config['SLOW_REQUEST_MS'] = int(os.getenv('SLOW_REQUEST_MS', 500))
+# With several worker processes, each writes its series to METRICS_DIR every
+# METRICS_FLUSH_INTERVAL seconds and /metrics adds up every worker's file,
+# including those of recycled workers; `serve` makes a temporary one if unset
+app.config['METRICS_DIR'] = os.getenv('METRICS_DIR')
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+# Background jobs: runner threads per process (0 runs jobs inline after the
+# request commits), attempts before a job is marked failed, base retry delay
+# in seconds (doubled per attempt), and seconds a claimed job stays locked
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 1))
+app.config['JOB_MAX_ATTEMPTS'] = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+app.config['JOB_RETRY_DELAY'] = float(os.getenv('JOB_RETRY_DELAY', 5))
+app.config['JOB_LOCK_TIMEOUT'] = int(os.getenv('JOB_LOCK_TIMEOUT', 300))
+app.config['JOB_POLL_INTERVAL'] = float(os.getenv('JOB_POLL_INTERVAL', 5))
+# Related posts kept per post, and tags shown in the sidebar tag cloud
+app.config['RELATED_POSTS_LIMIT'] = int(os.getenv('RELATED_POSTS_LIMIT', 5))
+app.config['TAG_CLOUD_SIZE'] = int(os.getenv('TAG_CLOUD_SIZE', 30))
+# Public address the server's workers request their warmup pages from; without
+# SITE_URL the feed cache is keyed by host, so set it to the site's URL
+app.config['WARMUP_BASE_URL'] = os.getenv('WARMUP_BASE_URL') or os.getenv('SITE_URL') or 'https://localhost'
+# Cache-Control sent with validated public pages, by endpoint; 'default' covers the rest
+app.config['CACHE_CONTROL'] = {
+    'default': 'public, no-cache',
+    'post_detail': 'public, max-age=60, must-revalidate',
+}
+
+# Initialize extensions; the database is bound to the app by create_app()
+db = SQLAlchemy()
+_app_initialized = False
+_app_init_lock = threading.Lock()
+
+
+def sqlalchemy_engine_options(uri):
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        # One writer at a time: a small pool that waits rather than erroring under bursts
+        return {
+            'pool_size': int(os.getenv('SQLITE_POOL_SIZE', 8)),
+            'max_overflow': 8,
+            'pool_timeout': 30,
+            'connect_args': {'timeout': app.config['SQLITE_PRAGMAS']['busy_timeout'] / 1000},
+        }
+    return {'pool_pre_ping': True}
+
+
+def create_app(config=None):
+    """
+    Apply `config` over the settings read from the environment and, once per
+    process, bind the database, set up Talisman and load the asset manifest.
+    The app also initializes itself on first use, so only callers overriding
+    settings (tests, benchmarks) need to call this before anything else.
+    """
+    global _app_initialized
+    config = config or {}
+    with _app_init_lock:
+        uri = config.get('SQLALCHEMY_DATABASE_URI', app.config['SQLALCHEMY_DATABASE_URI'])
+        if _app_initialized and uri != app.config['SQLALCHEMY_DATABASE_URI']:
+            raise RuntimeError('The database is already bound; call create_app() before using the app.')
+        app.config.update(config)
+        if not _app_initialized:
+            app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', sqlalchemy_engine_options(uri))
+            db.init_app(app)
+            init_security_headers()
+            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+            load_asset_manifest()
+            _app_initialized = True
+    return app
+
+
+@appcontext_pushed.connect_via(app)
+def initialize_on_first_use(sender, **extra):
+    if not _app_initialized:
+        create_app()
+
+
+@db.event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f'PRAGMA {pragma} = {value}')
+    cursor.close()
 
-# Initialize extensions
-db = SQLAlchemy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
-# Fetch admin credentials
-ADMIN_USERNAME = os.getenv('FLASK_ADMIN_USERNAME')
-ADMIN_PASSWORD = os.getenv('FLASK_ADMIN_PASSWORD') or 'dummy_password'  # Use 'dummy_password' if ADMIN_PASSWORD is None
-ADMIN_PASSWORD_HASH = generate_password_hash(ADMIN_PASSWORD)
+# Admin credentials. Set FLASK_ADMIN_PASSWORD_HASH (see `flask hash-password`)
+# to skip hashing FLASK_ADMIN_PASSWORD, which is otherwise done once per process
+app.config['ADMIN_USERNAME'] = os.getenv('FLASK_ADMIN_USERNAME')
+app.config['ADMIN_PASSWORD_HASH'] = os.getenv('FLASK_ADMIN_PASSWORD_HASH')
 
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+# Leading bytes of each accepted image format, and the extension it is stored under
+IMAGE_SIGNATURES = {
+    b'\x89PNG\r\n\x1a\n': 'png',
+    b'\xff\xd8\xff': 'jpg',
+    b'GIF87a': 'gif',
+    b'GIF89a': 'gif',
+}
+UPLOAD_CHUNK_SIZE = 64 * 1024
 
 
 csp = {
@@ -70,26 +221,31 @@ csp = {
     ]
 }
 
-if is_dev:
-    # Development settings - Disable CSP for local development
-    Talisman(
-        app,
-        force_https=False,
-        session_cookie_secure=False,
-        session_cookie_http_only=True,
-        content_security_policy=None,  # Disable CSP in development
-        feature_policy=None
-    )
-else:
-    # Production settings - Enable full security
-    Talisman(
-        app,
-        force_https=True,
-        session_cookie_secure=True,
-        session_cookie_http_only=True,
-        content_security_policy=csp,
-        content_security_policy_nonce_in=['script-src', 'style-src']
-    )
+
+def init_security_headers():
+    """Apply Talisman; called once from create_app(), like the other per-process setup"""
+    from flask_talisman import Talisman
+
+    if is_dev:
+        # Development settings - Disable CSP for local development
+        Talisman(
+            app,
+            force_https=False,
+            session_cookie_secure=False,
+            session_cookie_http_only=True,
+            content_security_policy=None,  # Disable CSP in development
+            feature_policy=None
+        )
+    else:
+        # Production settings - Enable full security
+        Talisman(
+            app,
+            force_https=True,
+            session_cookie_secure=True,
+            session_cookie_http_only=True,
+            content_security_policy=csp,
+            content_security_policy_nonce_in=['script-src', 'style-src']
+        )
 
 # Add a route to serve static files in development
 if is_dev:
@@ -108,6 +264,423 @@ def add_security_headers(response):
     response.headers['X-XSS-Protection'] = '1; mode=block'
     return response
 
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'application/json', 'application/xml', 'application/atom+xml', 'application/rss+xml',
+}
+_compressed_cache = OrderedDict()
+_compressed_lock = threading.Lock()
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+@app.after_request
+def compress_response(response):
+    """gzip or brotli-encode HTML, JSON and XML responses the client accepts"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers):
+        return response
+    encoding = 'br' if brotli is not None and request.accept_encodings['br'] else None
+    if encoding is None and request.accept_encodings['gzip']:
+        encoding = 'gzip'
+    response.vary.add('Accept-Encoding')
+    if encoding is None or response.content_length < app.config['COMPRESS_MIN_SIZE']:
+        return response
+
+    etag, _ = response.get_etag()
+    key = (request.full_path, etag, encoding)
+    body = None
+    if etag:
+        with _compressed_lock:
+            body = _compressed_cache.get(key)
+            if body is not None:
+                _compressed_cache.move_to_end(key)
+    if body is None:
+        body = compress(response.get_data(), encoding)
+        if etag:
+            with _compressed_lock:
+                _compressed_cache[key] = body
+                while len(_compressed_cache) > app.config['COMPRESS_CACHE_SIZE']:
+                    _compressed_cache.popitem(last=False)
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    if etag:
+        # The encoded body is a different representation of the same resource
+        response.set_etag(etag, weak=True)
+    return response
+
+
+# Fingerprinted static files: static/assets-manifest.json maps each source
+# path to a copy named after its content hash, written by `flask build-assets`.
+ASSET_MANIFEST = 'assets-manifest.json'
+ASSET_SKIP_DIRS = {'uploads'}
+PRECOMPRESSED_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml')
+# name.<12 hex digits>.ext, optionally .gz/.br: a copy written by build_assets()
+FINGERPRINTED_NAME = re.compile(r'\.[0-9a-f]{12}(\.[^./]+)?(\.gz|\.br)?$')
+asset_manifest = {}
+
+
+def load_asset_manifest():
+    path = os.path.join(app.static_folder, ASSET_MANIFEST)
+    asset_manifest.clear()
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            asset_manifest.update(json.load(f))
+    return asset_manifest
+
+
+def build_assets():
+    """
+    Copy each file under static/ to name.<hash>.ext, write .gz (and .br when
+    brotli is installed) next to text assets, and save the manifest. Copies
+    from builds before the previous one are removed; the previous build's
+    stay for pages rendered before this one.
+    """
+    previous = set(load_asset_manifest().values())
+    manifest = {}
+    generated = []
+    for root, dirs, files in os.walk(app.static_folder):
+        dirs[:] = [d for d in dirs if os.path.relpath(os.path.join(root, d), app.static_folder) not in ASSET_SKIP_DIRS]
+        for name in files:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, app.static_folder).replace(os.sep, '/')
+            if FINGERPRINTED_NAME.search(name):
+                generated.append(relative)
+                continue
+            if relative == ASSET_MANIFEST or name.endswith(('.gz', '.br')):
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            stem, extension = os.path.splitext(relative)
+            hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+            hashed_path = os.path.join(app.static_folder, hashed)
+            if not os.path.exists(hashed_path):
+                shutil.copyfile(path, hashed_path)
+            if extension in PRECOMPRESSED_EXTENSIONS:
+                for encoding, suffix in (('gzip', '.gz'), ('br', '.br')):
+                    if (encoding == 'br' and brotli is None) or os.path.exists(hashed_path + suffix):
+                        continue
+                    with open(hashed_path + suffix, 'wb') as f:
+                        f.write(brotli.compress(data, quality=11) if encoding == 'br' else gzip.compress(data, 9))
+            manifest[relative] = hashed
+    keep = previous | set(manifest.values())
+    for relative in generated:
+        if re.sub(r'\.(gz|br)$', '', relative) not in keep:
+            os.remove(os.path.join(app.static_folder, relative))
+    with open(os.path.join(app.static_folder, ASSET_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    load_asset_manifest()
+    return manifest
+
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    if endpoint == 'static' and values.get('filename') in asset_manifest:
+        values['filename'] = asset_manifest[values['filename']]
+
+
+def send_static_asset(filename):
+    """Serve static files; fingerprinted ones are immutable and sent precompressed when possible"""
+    if filename not in asset_manifest.values():
+        return app.send_static_file(filename)
+    response = None
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.exists(os.path.join(app.static_folder, filename + suffix)):
+            response = app.send_static_file(filename + suffix)
+            response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = app.send_static_file(filename)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+app.view_functions['static'] = send_static_asset
+
+
+# Instrumentation, exported in the Prometheus text format on /metrics
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_HELP = {
+    'tinytype_request_duration_seconds': ('histogram', 'Request latency by endpoint.'),
+    'tinytype_requests_total': ('counter', 'Requests by endpoint and status code.'),
+    'tinytype_sql_statements_total': ('counter', 'SQL statements executed by endpoint.'),
+    'tinytype_sql_duration_seconds': ('histogram', 'SQL statement execution time by endpoint.'),
+    'tinytype_template_render_seconds': ('histogram', 'Template render time by template.'),
+    'tinytype_markdown_render_seconds': ('histogram', 'Time spent converting and sanitizing markdown.'),
+    'tinytype_password_check_seconds': ('histogram', 'Time spent verifying login passwords.'),
+    'tinytype_cache_requests_total': ('counter', 'Cache lookups by cache and result (hit or miss).'),
+}
+
+
+class Metrics:
+    """Thread-safe counters and fixed-bucket histograms keyed by name and labels"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._file_pid = self._file_name = None
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # One count per bucket plus +Inf, then the running sum
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters), {key: list(value) for key, value in self._histograms.items()}
+
+    def save(self, directory):
+        """Write this process's series to its own file in `directory`"""
+        pid = os.getpid()
+        if self._file_pid != pid:
+            # A forked worker starts a file of its own; the pid lets render() tell when it exited
+            self._file_pid, self._file_name = pid, f'metrics-{pid}-{uuid.uuid4().hex}.json'
+        counters, histograms = self.snapshot()
+        write_metrics_file(os.path.join(directory, self._file_name), counters, histograms)
+
+    def render(self, directory=None):
+        """
+        Return every series in the Prometheus text exposition format: this
+        process's, or with `directory` the sum over every process's file there
+        """
+        if directory is None:
+            counters, histograms = self.snapshot()
+        else:
+            self.save(directory)
+            counters, histograms = merge_metrics_files(directory)
+        series = defaultdict(list)
+        for (name, labels), value in counters.items():
+            series[name].append(f'{name}{format_labels(labels)} {value:g}')
+        for (name, labels), histogram in histograms.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), histogram):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                series[name].append(f'{name}_bucket{format_labels(labels + (("le", le),))} {cumulative}')
+            series[name].append(f'{name}_sum{format_labels(labels)} {histogram[-1]:.6f}')
+            series[name].append(f'{name}_count{format_labels(labels)} {cumulative}')
+        lines = []
+        for name in sorted(series):
+            metric_type, help_text = METRIC_HELP.get(name, ('untyped', ''))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.extend(sorted(series[name]))
+        return '\n'.join(lines) + '\n'
+
+
+METRICS_ARCHIVE = 'metrics-archive.json'
+
+
+def write_metrics_file(path, counters, histograms):
+    data = {'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'histograms': [[name, labels, value] for (name, labels), value in histograms.items()]}
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+def read_metrics_file(path, counters, histograms):
+    """Add the series of one metrics file to `counters` and `histograms`"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    for name, labels, value in data['counters']:
+        counters[(name, tuple(tuple(label) for label in labels))] += value
+    for name, labels, value in data['histograms']:
+        key = (name, tuple(tuple(label) for label in labels))
+        histograms[key] = [a + b for a, b in zip(histograms[key], value)] if key in histograms else value
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merge_metrics_files(directory):
+    """
+    Sum the series of every worker's metrics file. Files of exited workers
+    are folded into one archive file, so their counts are kept and the
+    directory does not grow as workers are recycled.
+    """
+    def list_files():
+        return [name for name in os.listdir(directory) if name.startswith('metrics-') and name.endswith('.json')]
+
+    # Held while reading too, so a scrape never sees a file both on its own and in the archive
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        exited = [name for name in list_files()
+                  if name != METRICS_ARCHIVE and not process_alive(int(name.split('-')[1]))]
+        if exited:
+            counters, histograms = defaultdict(float), {}
+            archive = os.path.join(directory, METRICS_ARCHIVE)
+            for path in [os.path.join(directory, name) for name in exited] + [archive] * os.path.exists(archive):
+                read_metrics_file(path, counters, histograms)
+            write_metrics_file(archive, counters, histograms)
+            for name in exited:
+                os.remove(os.path.join(directory, name))
+        counters, histograms = defaultdict(float), {}
+        for name in list_files():
+            read_metrics_file(os.path.join(directory, name), counters, histograms)
+    return counters, histograms
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+             for key, value in labels)
+    return '{' + ','.join(pairs) + '}'
+
+
+metrics = Metrics()
+_metrics_flusher = None
+_metrics_flusher_lock = threading.Lock()
+
+
+def metrics_enabled():
+    return app.config['METRICS_ENABLED']
+
+
+def _run_metrics_flusher(directory):
+    while True:
+        time.sleep(max(app.config['METRICS_FLUSH_INTERVAL'], 0.1))
+        metrics.save(directory)
+
+
+def start_metrics_flusher():
+    """Save this process's series to METRICS_DIR in the background, once started by its first request"""
+    global _metrics_flusher
+    directory = app.config['METRICS_DIR']
+    if directory is None or _metrics_flusher == (os.getpid(), directory):
+        return
+    with _metrics_flusher_lock:
+        if _metrics_flusher != (os.getpid(), directory):
+            threading.Thread(target=_run_metrics_flusher, args=(directory,), name='metrics-flusher',
+                             daemon=True).start()
+            _metrics_flusher = (os.getpid(), directory)
+
+
+@atexit.register
+def _save_metrics_at_exit():
+    if _metrics_flusher is not None and _metrics_flusher[0] == os.getpid():
+        metrics.save(_metrics_flusher[1])
+
+
+def record_cache(cache, hit):
+    if metrics_enabled():
+        metrics.increment('tinytype_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def start_sql_timer(conn, cursor, statement, parameters, context, executemany):
+    if metrics_enabled():
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def record_sql_timing(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    if has_request_context() and 'metrics_started' in g:
+        endpoint = request.endpoint or 'unmatched'
+        metrics.increment('tinytype_sql_statements_total', endpoint=endpoint)
+        metrics.observe('tinytype_sql_duration_seconds', elapsed, endpoint=endpoint)
+        g.sql_statements.append((statement, elapsed))
+
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+    if metrics_enabled() and has_request_context():
+        g.setdefault('template_started', []).append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def record_template_timing(sender, template, context, **extra):
+    if has_request_context() and g.get('template_started'):
+        metrics.observe('tinytype_template_render_seconds', time.perf_counter() - g.template_started.pop(),
+                        template=template.name or 'string')
+
+
+@app.before_request
+def start_request_timer():
+    if metrics_enabled():
+        g.metrics_started = time.perf_counter()
+        g.sql_statements = []
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Record latency by endpoint and log slow requests with their SQL breakdown"""
+    if 'metrics_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.pop('metrics_started')
+    endpoint = request.endpoint or 'unmatched'
+    metrics.observe('tinytype_request_duration_seconds', elapsed, endpoint=endpoint)
+    metrics.increment('tinytype_requests_total', endpoint=endpoint, status=response.status_code)
+    start_metrics_flusher()
+    if elapsed * 1000 >= app.config['SLOW_REQUEST_MS']:
+        breakdown = defaultdict(lambda: [0, 0.0])
+        for statement, duration in g.sql_statements:
+            entry = breakdown[' '.join(statement.split())[:200]]
+            entry[0] += 1
+            entry[1] += duration
+        slowest = sorted(breakdown.items(), key=lambda item: item[1][1], reverse=True)[:5]
+        app.logger.warning(
+            'Slow request: %s %s (%s) took %.0fms; %d SQL statements in %.0fms%s',
+            request.method, request.full_path.rstrip('?'), endpoint, elapsed * 1000, len(g.sql_statements),
+            sum(duration for _, duration in g.sql_statements) * 1000,
+            ''.join(f'\n  {count}x {total * 1000:.1f}ms {statement}' for statement, (count, total) in slowest)
+        )
+    return response
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if not metrics_enabled():
+        abort(404)
+    token = app.config['METRICS_TOKEN']
+    supplied = request.headers.get('Authorization', '')
+    authorized = current_user.is_authenticated or (
+        token and hmac.compare_digest(supplied.encode('utf-8'), f'Bearer {token}'.encode('utf-8')))
+    if not authorized:
+        return app.response_class('Unauthorized\n', status=401, mimetype='text/plain',
+                                  headers={'WWW-Authenticate': 'Bearer realm="metrics"'})
+    response = app.response_class(metrics.render(app.config['METRICS_DIR']), mimetype='text/plain')
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 def secure_render(template_string, **context):
     if not isinstance(template_string, str):
         raise TypeError("Template must be a string")
@@ -120,54 +693,203 @@ def secure_render(template_string, **context):
     return render_template(template_string, **escaped_context)
 
 
+# Sanitizer configuration for rendered markdown
+MARKDOWN_ALLOWED_TAGS = [
+    'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'ul', 'ol', 'li', 'blockquote', 'pre', 'code',
+    'em', 'strong', 'a', 'img', 'table', 'thead', 'tbody',
+    'tr', 'th', 'td', 'br', 'hr'
+]
+
+MARKDOWN_ALLOWED_ATTRIBUTES = {
+    'a': ['href', 'title', 'rel'],
+    'img': ['src', 'alt', 'title'],
+    'code': ['class'],
+    '*': ['class']
+}
+
+MARKDOWN_ALLOWED_PROTOCOLS = ['http', 'https', 'mailto']
+
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables', 'codehilite']
+CODEHILITE_CSS_CLASS = 'highlight'
+
+# Fingerprint of the renderer configuration; bump RENDERER_VERSION when the
+# pipeline changes in a way the settings above do not capture.
+RENDERER_VERSION = 1
+RENDERER_FINGERPRINT = hashlib.sha256(json.dumps({
+    'version': RENDERER_VERSION,
+    'tags': MARKDOWN_ALLOWED_TAGS,
+    'attributes': MARKDOWN_ALLOWED_ATTRIBUTES,
+    'protocols': MARKDOWN_ALLOWED_PROTOCOLS,
+    'extensions': MARKDOWN_EXTENSIONS,
+    'codehilite_css_class': CODEHILITE_CSS_CLASS
+}, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class MarkdownRenderer:
+    """
+    Markdown to sanitized HTML with strict security and no template parsing.
+
+    The extension settings and allow-lists are built once. Markdown parsers
+    and bleach's Cleaner and Linker keep parser state between calls, so each
+    thread gets its own instances, created on first use and reset between
+    documents. Markdown and bleach are not imported until then.
+    """
+
+    def __init__(self, tags, attributes, protocols, codehilite_css_class):
+        self.tags = frozenset(tags)
+        self.attributes = {tag: list(names) for tag, names in attributes.items()}
+        self.protocols = frozenset(protocols)
+        self.codehilite_css_class = codehilite_css_class
+        self._local = threading.local()
+        self._pool = None
+
+    def _tools(self):
+        tools = getattr(self._local, 'tools', None)
+        if tools is None:
+            # Imported on first render rather than with the app: together
+            # with Pygments they are a large share of its import time
+            from bleach.linkifier import Linker
+            from bleach.sanitizer import Cleaner
+            from markdown import Markdown
+            from markdown.extensions.codehilite import CodeHiliteExtension
+            from markdown.extensions.fenced_code import FencedCodeExtension
+            from markdown.extensions.tables import TableExtension
+
+            parser = Markdown(extensions=[
+                FencedCodeExtension(),
+                TableExtension(),
+                CodeHiliteExtension(css_class=self.codehilite_css_class)
+            ])
+            cleaner = Cleaner(tags=self.tags, attributes=self.attributes, protocols=self.protocols, strip=True)
+            linker = Linker(parse_email=True)
+            tools = self._local.tools = (parser, cleaner, linker)
+        return tools
+
+    def render(self, content):
+        if not content:
+            return ''
+        started = time.perf_counter()
+        parser, cleaner, linker = self._tools()
+
+        # First escape any HTML to prevent injection, then convert, sanitize
+        # and turn bare URLs into links
+        html_content = parser.reset().convert(html.escape(content))
+        linked_html = linker.linkify(cleaner.clean(html_content))
+
+        if metrics_enabled():
+            metrics.observe('tinytype_markdown_render_seconds', time.perf_counter() - started)
+        return Markup(linked_html)
+
+    def render_many(self, contents, jobs=1):
+        """
+        Render a batch of documents in order. With `jobs` above 1 they are
+        split across a process pool that is kept for later batches.
+        """
+        contents = list(contents)
+        if jobs <= 1 or len(contents) < 2:
+            return [self.render(content) for content in contents]
+        if self._pool is None or self._pool[0] != jobs:
+            if self._pool is not None:
+                self._pool[1].shutdown()
+            self._pool = (jobs, ProcessPoolExecutor(max_workers=jobs))
+        rendered = self._pool[1].map(render_markdown_str, contents, chunksize=max(len(contents) // (jobs * 4), 1))
+        return [Markup(html_content) for html_content in rendered]
+
+
+markdown_renderer = MarkdownRenderer(
+    MARKDOWN_ALLOWED_TAGS, MARKDOWN_ALLOWED_ATTRIBUTES, MARKDOWN_ALLOWED_PROTOCOLS, CODEHILITE_CSS_CLASS
+)
+
+
 @app.template_filter('markdown')
 def markdown_to_html(content):
     """
     Convert markdown to HTML with strict security and no template parsing
     """
-    if not content:
-        return ''
+    return markdown_renderer.render(content)
 
-    # First escape any HTML to prevent injection
-    content = html.escape(content)
 
-    # Convert markdown to HTML with specific extensions
-    html_content = markdown(
-        content,
-        extensions=[
-            FencedCodeExtension(),
-            TableExtension(),
-            CodeHiliteExtension(css_class='highlight')
-        ]
-    )
+def render_markdown_str(content):
+    # Picklable entry point for worker processes
+    return str(markdown_renderer.render(content))
 
-    # Clean and sanitize HTML
-    allowed_tags = [
-        'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-        'ul', 'ol', 'li', 'blockquote', 'pre', 'code',
-        'em', 'strong', 'a', 'img', 'table', 'thead', 'tbody',
-        'tr', 'th', 'td', 'br', 'hr'
-    ]
 
-    allowed_attributes = {
-        'a': ['href', 'title', 'rel'],
-        'img': ['src', 'alt', 'title'],
-        'code': ['class'],
-        '*': ['class']
-    }
+EXCERPT_LENGTH = 300
 
-    cleaned_html = clean(
-        html_content,
-        tags=allowed_tags,
-        attributes=allowed_attributes,
-        protocols=['http', 'https', 'mailto'],
-        strip=True
-    )
 
-    # Automatically convert URLs to links
-    linked_html = linkify(cleaned_html, parse_email=True)
+def split_excerpt(content, length=EXCERPT_LENGTH):
+    """
+    Return (excerpt, truncated) where excerpt is the leading markdown blocks of
+    content up to roughly `length` characters. Blocks are separated by blank
+    lines outside fenced code, so fences and tables are never cut in half.
+    """
+    if not content:
+        return '', False
+
+    blocks = []
+    current = []
+    fence = None
+    for line in content.splitlines():
+        stripped = line.strip()
+        if fence is None and stripped[:3] in ('```', '~~~'):
+            fence = stripped[:3]
+        elif fence is not None and stripped.startswith(fence):
+            fence = None
+        if not stripped and fence is None:
+            if current:
+                blocks.append('\n'.join(current))
+                current = []
+        else:
+            current.append(line)
+    if current:
+        blocks.append('\n'.join(current))
+    if not blocks:
+        return '', False
+
+    excerpt = []
+    size = 0
+    for block in blocks:
+        if excerpt and size + len(block) > length:
+            break
+        excerpt.append(block)
+        size += len(block)
+
+    truncated = len(excerpt) < len(blocks)
+    # A single oversized paragraph is cut at a word boundary; fences and
+    # tables are kept whole.
+    first = excerpt[0]
+    if len(excerpt) == 1 and len(first) > length and '\n' not in first.strip():
+        cut = first.rfind(' ', 0, length)
+        excerpt[0] = first[:cut if cut > 0 else length].rstrip()
+        truncated = True
+
+    return '\n\n'.join(excerpt), truncated
+
+
+def render_post_content(content):
+    """Return (content_hash, content_html, excerpt_html, excerpt_truncated) for markdown content"""
+    excerpt, truncated = split_excerpt(content)
+    return render_hash(content), str(markdown_to_html(content)), str(markdown_to_html(excerpt)), truncated
+
+
+def render_post_contents(contents, jobs=1):
+    """render_post_content() for a batch, rendering bodies and excerpts in one render_many() call"""
+    contents = list(contents)
+    excerpts = [split_excerpt(content) for content in contents]
+    rendered = markdown_renderer.render_many(contents + [excerpt for excerpt, _ in excerpts], jobs=jobs)
+    return [
+        (render_hash(content), str(content_html), str(excerpt_html), truncated)
+        for content, content_html, excerpt_html, (_, truncated)
+        in zip(contents, rendered, rendered[len(contents):], excerpts)
+    ]
 
-    return Markup(linked_html)
+
+def render_hash(content):
+    """Cache key for rendered content: the markdown source plus renderer configuration"""
+    digest = hashlib.sha256(RENDERER_FINGERPRINT.encode('utf-8'))
+    digest.update((content or '').encode('utf-8'))
+    return digest.hexdigest()
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -177,10 +899,14 @@ class User(UserMixin, db.Model):
 class Tag(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
+    # Maintained by refresh_tag_counts() when posts change; indexed for the tag cloud
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
 
 post_tags = db.Table('post_tags',
     db.Column('post_id', db.Integer, db.ForeignKey('post.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    # The primary key serves post -> tags; this serves tag -> posts
+    db.Index('ix_post_tags_tag_id', 'tag_id', 'post_id')
 )
 
 class Category(db.Model):
@@ -189,38 +915,637 @@ class Category(db.Model):
 
 post_categories = db.Table('post_categories',
     db.Column('post_id', db.Integer, db.ForeignKey('post.id'), primary_key=True),
-    db.Column('category_id', db.Integer, db.ForeignKey('category.id'), primary_key=True)
+    db.Column('category_id', db.Integer, db.ForeignKey('category.id'), primary_key=True),
+    db.Index('ix_post_categories_category_id', 'category_id', 'post_id')
+)
+
+# The RELATED_POSTS_LIMIT posts most similar to each post, see update_related_posts()
+related_post = db.Table('related_post',
+    db.Column('post_id', db.Integer, primary_key=True),
+    db.Column('related_id', db.Integer, primary_key=True),
+    db.Column('score', db.Float, nullable=False),
+    db.Index('ix_related_post_related_id', 'related_id')
 )
 
 class Draft(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     title = db.Column(db.String(100))
     content = db.Column(db.Text)
     tags = db.Column(db.Text)  # Store as JSON string
     categories = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Incremented on every accepted autosave; clients send it back to detect conflicts
+    version = db.Column(db.Integer, default=0)
 
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     content = db.Column(db.Text, nullable=False)
     date_posted = db.Column(db.DateTime, default=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Bumped explicitly by edit_post, since tag and category changes do not touch the post row
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     user = db.relationship('User', backref=db.backref('posts', lazy=True))
-    tags = db.relationship('Tag', secondary=post_tags, lazy='subquery',
+    tags = db.relationship('Tag', secondary=post_tags, lazy='selectin',
         backref=db.backref('posts', lazy=True))
-    categories = db.relationship('Category', secondary=post_categories, lazy='subquery',
+    categories = db.relationship('Category', secondary=post_categories, lazy='selectin',
         backref=db.backref('posts', lazy=True))
+    # Sanitized HTML rendered at write time, keyed by render_hash(content)
+    content_html = db.Column(db.Text)
+    content_hash = db.Column(db.String(64))
+    # Rendered leading blocks shown on listing pages
+    excerpt_html = db.Column(db.Text)
+    excerpt_truncated = db.Column(db.Boolean, default=False)
+
+    def render(self):
+        """Render the markdown content and excerpt and store the sanitized HTML on the post"""
+        self.apply_rendered(render_post_content(self.content))
+
+    def apply_rendered(self, rendered):
+        """Store a render_post_content() result, e.g. one computed in a worker process"""
+        self.content_hash, self.content_html, self.excerpt_html, self.excerpt_truncated = rendered
+
+    def is_rendered(self):
+        return (self.content_html is not None and self.excerpt_html is not None
+                and self.content_hash == render_hash(self.content))
+
+    @property
+    def html(self):
+        """Stored HTML when it is current, otherwise render on the fly"""
+        rendered = self.is_rendered()
+        record_cache('markdown', rendered)
+        if rendered:
+            return Markup(self.content_html)
+        return markdown_to_html(self.content)
+
+    @property
+    def excerpt(self):
+        """Stored excerpt HTML when it is current, otherwise render on the fly"""
+        rendered = self.is_rendered()
+        record_cache('markdown', rendered)
+        if rendered:
+            return Markup(self.excerpt_html)
+        return markdown_to_html(split_excerpt(self.content)[0])
+
+    # Serves the (date_posted, id) ORDER BY and keyset filters of the listings
+    __table_args__ = (db.Index('ix_post_date_posted_id', 'date_posted', 'id'),)
 
     def __repr__(self):
         return '<Post %r>' % self.id
 
 
+@db.event.listens_for(Post.content, 'set')
+def clear_stale_html(post, value, oldvalue, initiator):
+    """Drop the stored HTML when the content changes, so readers that skip the
+    content column (the JSON API) see a NULL until the render job runs"""
+    if value != oldvalue:
+        post.content_hash = post.content_html = post.excerpt_html = None
+
+
+class Job(db.Model):
+    """Deferred work on a post, run by the background job runner"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    # Not a foreign key: jobs for deleted posts still run (e.g. to unindex them)
+    post_id = db.Column(db.Integer)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # A running job whose lock expired was abandoned by a dead worker and is claimed again
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # At most one pending job per kind and post; the runner picks due jobs in order
+    __table_args__ = (
+        db.Index('ix_job_pending_post', 'kind', 'post_id', unique=True,
+                 sqlite_where=db.text("status = 'pending'"), postgresql_where=db.text("status = 'pending'")),
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+
+
+class ContentState(db.Model):
+    """
+    A single row recording when a post was last deleted. Deletions leave no
+    updated_at behind, so Last-Modified takes the later of the two.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    post_deleted_at = db.Column(db.DateTime)
+
+
+def record_post_deletion():
+    db.session.merge(ContentState(id=1, post_deleted_at=datetime.utcnow()))
+
+
+def dialect_insert(dialect):
+    """The insert() construct with ON CONFLICT support for 'sqlite' or 'postgresql'"""
+    if dialect == 'sqlite':
+        return sqlite_insert
+    # Only loaded when the app actually runs on PostgreSQL
+    from sqlalchemy.dialects.postgresql import insert
+    return insert
+
+
+def resolve_names(model, names):
+    """
+    Return the Tag or Category rows for `names`, creating the missing ones.
+
+    Existing rows are fetched with one IN query and missing ones inserted in
+    one statement that ignores names another request created meanwhile.
+    Blank and duplicate names are dropped; the input order is kept.
+    """
+    names = list(dict.fromkeys(name.strip() for name in names if name and name.strip()))
+    if not names:
+        return []
+
+    with db.session.no_autoflush:
+        rows = {row.name: row for row in model.query.filter(model.name.in_(names))}
+        missing = [name for name in names if name not in rows]
+        if missing:
+            dialect = db.engine.dialect.name
+            if dialect in ('sqlite', 'postgresql'):
+                insert = dialect_insert(dialect)
+                db.session.execute(
+                    insert(model.__table__).on_conflict_do_nothing(index_elements=['name']),
+                    [{'name': name} for name in missing]
+                )
+            else:
+                for name in missing:
+                    try:
+                        with db.session.begin_nested():
+                            db.session.add(model(name=name))
+                    except IntegrityError:
+                        pass
+            rows.update((row.name, row) for row in model.query.filter(model.name.in_(missing)))
+    return [rows[name] for name in names]
+
+
+PostPage = namedtuple('PostPage', ['posts', 'older_url', 'newer_url'])
+
+# Loader options for listing pages: the author is joined into the page query
+# and each collection is fetched with a single IN query for the whole page.
+LISTING_LOAD_OPTIONS = (
+    db.joinedload(Post.user),
+    db.selectinload(Post.tags),
+    db.selectinload(Post.categories),
+)
+# search_results.html shows tags but not categories
+SEARCH_LOAD_OPTIONS = (
+    db.joinedload(Post.user),
+    db.selectinload(Post.tags),
+    db.lazyload(Post.categories),
+)
+
+
+def encode_cursor(post):
+    return f'{post.date_posted.isoformat()}_{post.id}'
+
+
+def decode_cursor(value):
+    """Parse a (date_posted, id) cursor, returning None for missing or malformed values"""
+    if not value:
+        return None
+    try:
+        date_posted, post_id = value.rsplit('_', 1)
+        return datetime.fromisoformat(date_posted), int(post_id)
+    except ValueError:
+        return None
+
+
+def paginate_posts(query, per_page=None):
+    """
+    Keyset pagination over (date_posted, id), newest first. Pages are selected
+    with ?before=<cursor> (older posts) or ?after=<cursor> (newer posts), so
+    deep pages cost the same as the first one. `query` may also select plain
+    columns, as long as it includes Post.id and Post.date_posted.
+    """
+    per_page = per_page or app.config['POSTS_PER_PAGE']
+    key = db.tuple_(Post.date_posted, Post.id)
+    before = decode_cursor(request.args.get('before'))
+    after = decode_cursor(request.args.get('after')) if before is None else None
+
+    if after is not None:
+        posts = query.filter(key > db.tuple_(*after)) \
+            .order_by(Post.date_posted.asc(), Post.id.asc()).limit(per_page + 1).all()
+        has_newer = len(posts) > per_page
+        posts = posts[:per_page][::-1]
+        has_older = True
+    else:
+        if before is not None:
+            query = query.filter(key < db.tuple_(*before))
+        posts = query.order_by(Post.date_posted.desc(), Post.id.desc()).limit(per_page + 1).all()
+        has_older = len(posts) > per_page
+        posts = posts[:per_page]
+        has_newer = before is not None
+
+    args = {k: v for k, v in request.args.items() if k not in ('before', 'after')}
+    args.update(request.view_args or {})
+    older_url = newer_url = None
+    if posts and has_older:
+        older_url = url_for(request.endpoint, before=encode_cursor(posts[-1]), **args)
+    if posts and has_newer:
+        newer_url = url_for(request.endpoint, after=encode_cursor(posts[0]), **args)
+    elif has_newer:
+        newer_url = url_for(request.endpoint, **args)
+    return PostPage(posts, older_url, newer_url)
+
+
+# Full-text search index: an FTS5 table whose rowid is the post id, holding
+# the title, content and space separated tag and category names.
+SEARCH_TABLE = 'post_search'
+# bm25 column weights for title, content, tags and categories
+SEARCH_WEIGHTS = (10.0, 1.0, 5.0, 5.0)
+SNIPPET_START, SNIPPET_END = '\x02', '\x03'
+SEARCH_TABLE_DDL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} '
+    'USING fts5(title, content, tags, categories, tokenize="unicode61 remove_diacritics 2")'
+)
+
+SEARCH_SOURCE_SQL = """
+    SELECT post.id, post.title, post.content,
+        (SELECT group_concat(tag.name, ' ') FROM tag
+            JOIN post_tags ON post_tags.tag_id = tag.id WHERE post_tags.post_id = post.id),
+        (SELECT group_concat(category.name, ' ') FROM category
+            JOIN post_categories ON post_categories.category_id = category.id
+            WHERE post_categories.post_id = post.id)
+    FROM post
+"""
+
+db.event.listen(Post.__table__, 'after_create', db.DDL(SEARCH_TABLE_DDL).execute_if(dialect='sqlite'))
+db.event.listen(Post.__table__, 'before_drop', db.DDL(
+    f'DROP TABLE IF EXISTS {SEARCH_TABLE}'
+).execute_if(dialect='sqlite'))
+
+
+def search_index_enabled():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def index_post(post):
+    """Refresh the search index row of a post inside the current transaction"""
+    db.session.flush()
+    index_posts([post.id])
+
+
+def index_posts(post_ids):
+    """Refresh the search index rows of flushed posts inside the current transaction"""
+    if not search_index_enabled() or not post_ids:
+        return
+    ids = db.bindparam('ids', expanding=True)
+    db.session.execute(db.text(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN :ids').bindparams(ids),
+                       {'ids': post_ids})
+    db.session.execute(db.text(
+        f'INSERT INTO {SEARCH_TABLE} (rowid, title, content, tags, categories) '
+        f'{SEARCH_SOURCE_SQL} WHERE post.id IN :ids'
+    ).bindparams(ids), {'ids': post_ids})
+
+
+def unindex_post(post_id):
+    if search_index_enabled():
+        db.session.execute(db.text(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = :id'), {'id': post_id})
+
+
+def rebuild_search_index():
+    """Recreate the search index from the post, tag and category tables"""
+    db.session.execute(db.text(f'DELETE FROM {SEARCH_TABLE}'))
+    db.session.execute(db.text(
+        f'INSERT INTO {SEARCH_TABLE} (rowid, title, content, tags, categories) {SEARCH_SOURCE_SQL}'
+    ))
+    db.session.execute(db.text(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')"))
+    db.session.commit()
+
+
+def fts_query(text):
+    """Turn user input into an FTS5 query of quoted prefix terms, all of which must match"""
+    terms = [term.replace('"', '""') for term in text.split()]
+    return ' '.join(f'"{term}"*' for term in terms if term.strip('"'))
+
+
+def search_posts(text):
+    """
+    Rank posts matching `text` by bm25 and return a PostPage plus a dict of
+    highlighted snippets keyed by post id. Pages are selected with ?page=N.
+    """
+    per_page = app.config['POSTS_PER_PAGE']
+    page_number = max(request.args.get('page', 1, type=int), 1)
+    match = fts_query(text)
+    if not match:
+        return PostPage([], None, None), {}
+
+    rows = db.session.execute(db.text(
+        f'SELECT rowid, snippet({SEARCH_TABLE}, -1, :start, :end, :ellipsis, 24) '
+        f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match '
+        f'ORDER BY bm25({SEARCH_TABLE}, {", ".join(map(str, SEARCH_WEIGHTS))}), rowid DESC '
+        'LIMIT :limit OFFSET :offset'
+    ), {
+        'start': SNIPPET_START, 'end': SNIPPET_END, 'ellipsis': '...', 'match': match,
+        'limit': per_page + 1, 'offset': (page_number - 1) * per_page
+    }).all()
+
+    has_older = len(rows) > per_page
+    rows = rows[:per_page]
+    posts_by_id = {
+        post.id: post
+        for post in Post.query.options(*SEARCH_LOAD_OPTIONS).filter(Post.id.in_([row[0] for row in rows]))
+    }
+    posts = [posts_by_id[row[0]] for row in rows if row[0] in posts_by_id]
+    snippets = {
+        row[0]: Markup(str(escape(row[1] or '')).replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>'))
+        for row in rows
+    }
+
+    args = {k: v for k, v in request.args.items() if k != 'page'}
+    older_url = url_for(request.endpoint, page=page_number + 1, **args) if has_older else None
+    newer_url = url_for(request.endpoint, page=page_number - 1, **args) if page_number > 1 else None
+    return PostPage(posts, older_url, newer_url), snippets
+
+
+# Related posts: posts are scored by their shared tags and categories, and
+# the best RELATED_POSTS_LIMIT of each are materialized in related_post.
+# Scores only depend on the two posts involved, so a change to one post
+# touches only its own row set and the sets it enters or leaves.
+RELATED_TAG_WEIGHT = 2.0
+RELATED_CATEGORY_WEIGHT = 1.0
+
+RELATED_SCORES_SQL = """
+    SELECT source_id, related_id, SUM(weight) AS score FROM (
+        SELECT a.post_id AS source_id, b.post_id AS related_id, CAST(:tag_weight AS FLOAT) AS weight
+        FROM post_tags a JOIN post_tags b ON b.tag_id = a.tag_id AND b.post_id != a.post_id
+        WHERE a.post_id IN :ids
+        UNION ALL
+        SELECT a.post_id, b.post_id, CAST(:category_weight AS FLOAT)
+        FROM post_categories a JOIN post_categories b ON b.category_id = a.category_id AND b.post_id != a.post_id
+        WHERE a.post_id IN :ids
+    ) AS shared
+    GROUP BY source_id, related_id
+"""
+
+RELATED_TOP_SQL = f"""
+    INSERT INTO related_post (post_id, related_id, score)
+    SELECT source_id, related_id, score FROM (
+        SELECT source_id, related_id, score, ROW_NUMBER() OVER (
+            PARTITION BY source_id ORDER BY score DESC, related_id DESC
+        ) AS position
+        FROM ({RELATED_SCORES_SQL}) AS scores
+    ) AS ranked
+    WHERE position <= :limit
+"""
+
+
+def related_params(post_ids):
+    return {'ids': list(post_ids), 'tag_weight': RELATED_TAG_WEIGHT,
+            'category_weight': RELATED_CATEGORY_WEIGHT, 'limit': app.config['RELATED_POSTS_LIMIT']}
+
+
+def refresh_related_posts(post_ids):
+    """Recompute the related posts of `post_ids` from scratch in the current transaction"""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    ids = db.bindparam('ids', expanding=True)
+    db.session.execute(db.delete(related_post).where(related_post.c.post_id.in_(post_ids)))
+    db.session.execute(db.text(RELATED_TOP_SQL).bindparams(ids), related_params(post_ids))
+
+
+def update_related_posts(post_id):
+    """
+    Bring the index up to date after the tags or categories of `post_id`
+    changed, or it was deleted: recompute it and every post that listed it,
+    and add it to the lists of other posts it now ranks in.
+    """
+    db.session.flush()
+    limit = app.config['RELATED_POSTS_LIMIT']
+    listed_by = set(db.session.execute(
+        db.select(related_post.c.post_id).where(related_post.c.related_id == post_id)).scalars())
+    db.session.execute(db.delete(related_post).where(
+        db.or_(related_post.c.post_id == post_id, related_post.c.related_id == post_id)))
+    refresh_related_posts([post_id, *listed_by])
+
+    scores = {related_id: score for _, related_id, score in db.session.execute(
+        db.text(RELATED_SCORES_SQL).bindparams(db.bindparam('ids', expanding=True)), related_params([post_id]))}
+    candidates = [other for other in scores if other not in listed_by]
+    for start in range(0, len(candidates), 500):
+        chunk = candidates[start:start + 500]
+        current = defaultdict(list)
+        for source_id, related_id, score in db.session.execute(
+                db.select(related_post).where(related_post.c.post_id.in_(chunk))):
+            current[source_id].append((score, related_id))
+        inserts, evictions = [], []
+        for other in chunk:
+            entry = (scores[other], post_id)
+            if len(current[other]) < limit:
+                inserts.append({'post_id': other, 'related_id': post_id, 'score': scores[other]})
+            elif entry > min(current[other]):
+                inserts.append({'post_id': other, 'related_id': post_id, 'score': scores[other]})
+                evictions.append({'source': other, 'evicted': min(current[other])[1]})
+        if evictions:
+            db.session.execute(db.delete(related_post).where(
+                related_post.c.post_id == db.bindparam('source'),
+                related_post.c.related_id == db.bindparam('evicted')), evictions)
+        if inserts:
+            db.session.execute(db.insert(related_post), inserts)
+
+
+def rebuild_related_posts(batch_size=500):
+    """Recompute the whole related-posts index"""
+    db.session.execute(db.delete(related_post))
+    post_ids = db.session.execute(db.select(Post.id).order_by(Post.id)).scalars().all()
+    for start in range(0, len(post_ids), batch_size):
+        refresh_related_posts(post_ids[start:start + batch_size])
+    db.session.commit()
+
+
+def related_posts(post_id):
+    """(id, title) of the posts related to `post_id`, most similar first"""
+    return db.session.query(Post.id, Post.title) \
+        .join(related_post, related_post.c.related_id == Post.id) \
+        .filter(related_post.c.post_id == post_id) \
+        .order_by(related_post.c.score.desc(), related_post.c.related_id.desc()).all()
+
+
+def refresh_tag_counts(tag_ids=None):
+    """Recount the posts of `tag_ids`, or of every tag, in the current transaction"""
+    db.session.flush()
+    count = db.select(db.func.count()).select_from(post_tags).where(post_tags.c.tag_id == Tag.id).scalar_subquery()
+    statement = db.update(Tag).values(post_count=count)
+    if tag_ids is not None:
+        tag_ids = list(set(tag_ids))
+        if not tag_ids:
+            return
+        statement = statement.where(Tag.id.in_(tag_ids))
+    db.session.execute(statement.execution_options(synchronize_session=False))
+
+
+class CachedValue:
+    """
+    A value computed by `loader` and kept in process memory until it is
+    invalidated or `ttl_key` seconds (read from app.config) have passed. The
+    TTL bounds staleness when another worker process makes the change.
+    `name` labels its hit rate in /metrics.
+    """
+
+    def __init__(self, loader, ttl_key, name):
+        self.loader = loader
+        self.ttl_key = ttl_key
+        self.name = name
+        # (value, expires) swapped as one object, so readers never see a
+        # value from one load with the expiry of another, or a cleared value
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        hit = True
+        entry = self._entry
+        if entry is None or time.monotonic() >= entry[1]:
+            with self._lock:
+                entry = self._entry
+                if entry is None or time.monotonic() >= entry[1]:
+                    entry = self._entry = (self.loader(), time.monotonic() + app.config[self.ttl_key])
+                    hit = False
+        record_cache(self.name, hit)
+        return entry[0]
+
+    def invalidate(self):
+        with self._lock:
+            self._entry = None
+
+
+SidebarCategory = namedtuple('SidebarCategory', ['id', 'name', 'post_count'])
+
+
+def load_sidebar_categories():
+    rows = db.session.query(Category.id, Category.name, db.func.count(post_categories.c.post_id)) \
+        .outerjoin(post_categories, post_categories.c.category_id == Category.id) \
+        .group_by(Category.id, Category.name).order_by(Category.name).all()
+    return tuple(SidebarCategory(*row) for row in rows)
+
+
+category_cache = CachedValue(load_sidebar_categories, 'CATEGORY_CACHE_TTL', 'categories')
+
+
+@app.context_processor
+def inject_sidebar():
+    return {'sidebar_categories': category_cache.get(), 'sidebar_tags': tag_cloud_cache.get()}
+
+
+def load_tag_counts():
+    rows = db.session.query(Tag.id, Tag.name, Tag.post_count).order_by(Tag.name).all()
+    return tuple({'id': tag_id, 'name': name, 'post_count': count or 0} for tag_id, name, count in rows)
+
+
+tag_cache = CachedValue(load_tag_counts, 'CATEGORY_CACHE_TTL', 'tags')
+
+TagCloudEntry = namedtuple('TagCloudEntry', ['name', 'post_count', 'level'])
+TAG_CLOUD_LEVELS = 5
+
+
+def load_tag_cloud():
+    """The TAG_CLOUD_SIZE most used tags by name, each with a size level from 1 to TAG_CLOUD_LEVELS"""
+    rows = db.session.query(Tag.name, Tag.post_count).filter(Tag.post_count > 0) \
+        .order_by(Tag.post_count.desc(), Tag.name).limit(app.config['TAG_CLOUD_SIZE']).all()
+    if not rows:
+        return ()
+    most = math.log(rows[0][1] + 1)
+    return tuple(sorted(
+        (TagCloudEntry(name, count, 1 + round((TAG_CLOUD_LEVELS - 1) * math.log(count + 1) / most) if most else 1)
+         for name, count in rows),
+        key=lambda entry: entry.name.lower()
+    ))
+
+
+tag_cloud_cache = CachedValue(load_tag_cloud, 'CATEGORY_CACHE_TTL', 'tag_cloud')
+
+# Serialized feeds by (format, category id or None, site URL), least recently used first
+feed_caches = OrderedDict()
+_feed_caches_lock = threading.Lock()
+
+
+def content_changed():
+    """Drop the caches derived from posts, tags and categories after a write"""
+    category_cache.invalidate()
+    tag_cache.invalidate()
+    tag_cloud_cache.invalidate()
+    with _feed_caches_lock:
+        caches = list(feed_caches.values())
+    for cache in caches:
+        cache.invalidate()
+
+
+def conditional_page(version, last_modified, render):
+    """
+    Answer If-None-Match / If-Modified-Since with 304 before calling `render`.
+
+    `version` is any repr-able value that changes whenever the page would;
+    the strong ETag is derived from it together with the sidebar categories.
+    Pages for logged-in users are never validated or shared.
+    """
+    if current_user.is_authenticated:
+        response = make_response(render())
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+
+    etag = hashlib.sha256(repr((version, category_cache.get())).encode('utf-8')).hexdigest()[:32]
+    if last_modified is not None:
+        last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = (request.if_modified_since is not None and last_modified is not None
+                        and last_modified <= request.if_modified_since)
+
+    response = app.response_class(status=304) if not_modified else make_response(render())
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    cache_control = app.config['CACHE_CONTROL']
+    response.headers['Cache-Control'] = cache_control.get(request.endpoint, cache_control['default'])
+    response.vary.add('Cookie')
+    return response
+
+
+def listing_version():
+    """Newest modification or deletion time and row count of the post table"""
+    deleted_at = db.select(ContentState.post_deleted_at).where(ContentState.id == 1).scalar_subquery()
+    updated_at, count, deleted_at = db.session.query(
+        db.func.max(Post.updated_at), db.func.count(Post.id), deleted_at).one()
+    return max(filter(None, (updated_at, deleted_at)), default=None), count
+
+
+class SessionUser(UserMixin):
+    """The part of a User that requests read through current_user"""
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+
+session_users = {}
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    # Users are only ever created, never edited or deleted, so the row behind
+    # a session is read once per process rather than on every request
+    user = session_users.get(int(user_id))
+    if metrics_enabled():
+        record_cache('session_users', user is not None)
+    if user is None:
+        row = db.session.execute(db.select(User.id, User.username).filter_by(id=int(user_id))).first()
+        if row is None:
+            return None
+        user = session_users[row.id] = SessionUser(row.id, row.username)
+    return user
+
+
+def admin_password_hash():
+    """The configured admin password hash, or one made from FLASK_ADMIN_PASSWORD on first use"""
+    if not app.config['ADMIN_PASSWORD_HASH']:
+        # Hash 'dummy_password' when no password is set, so logins still take the usual time
+        app.config['ADMIN_PASSWORD_HASH'] = generate_password_hash(os.getenv('FLASK_ADMIN_PASSWORD') or 'dummy_password')
+    return app.config['ADMIN_PASSWORD_HASH']
+
 
 class PostForm(FlaskForm):
     title = StringField('Title', validators=[DataRequired()])
@@ -234,10 +1559,14 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        if username == ADMIN_USERNAME and check_password_hash(ADMIN_PASSWORD_HASH, password):
-            user = User.query.filter_by(username=ADMIN_USERNAME).first()
+        started = time.perf_counter()
+        valid = check_password_hash(admin_password_hash(), password)
+        if metrics_enabled():
+            metrics.observe('tinytype_password_check_seconds', time.perf_counter() - started)
+        if username == app.config['ADMIN_USERNAME'] and valid:
+            user = User.query.filter_by(username=username).first()
             if user is None:
-                user = User(username=ADMIN_USERNAME, password=ADMIN_PASSWORD_HASH)
+                user = User(username=username, password=admin_password_hash())
                 db.session.add(user)
                 db.session.commit()
             login_user(user)
@@ -254,39 +1583,348 @@ def logout():
 
 @app.route('/')
 def home():
-    posts = Post.query.order_by(Post.date_posted.desc()).all()
-    categories = Category.query.all()
-    return render_template('home.html', posts=posts, categories=categories, show_sidebar=True)
+    last_modified, count = listing_version()
+
+    def render():
+        page = paginate_posts(Post.query.options(*LISTING_LOAD_OPTIONS))
+        return render_template('home.html', posts=page.posts, page=page, show_sidebar=True)
+
+    return conditional_page((last_modified, count), last_modified, render)
 
 @app.route('/category/<int:category_id>')
 def posts_by_category(category_id):
     category = Category.query.get_or_404(category_id)
-    posts = Post.query.filter(Post.categories.any(id=category.id)).order_by(Post.date_posted.desc()).all()
-    categories = Category.query.all()
-    return render_template('posts_by_category.html', posts=posts, category=category, categories=categories)
+    last_modified, count = listing_version()
+
+    def render():
+        page = paginate_posts(Post.query.options(*LISTING_LOAD_OPTIONS).filter(Post.categories.any(id=category.id)))
+        return render_template('posts_by_category.html', posts=page.posts, page=page, category=category)
+
+    return conditional_page((category.name, last_modified, count), last_modified, render)
 
 
 @app.route('/post/<int:id>')
 def post_detail(id):
-    post = db.session.get(Post, id)
-    if post is None:
+    # Only the version columns are needed to answer a revalidation
+    row = db.session.query(Post.id, Post.updated_at).filter(Post.id == id).first()
+    if row is None:
         return 'Post not found', 404
+    # Related posts and the sidebar change with other posts. The related list
+    # itself is part of the version: the relate_post job fills it after the
+    # post is saved, without touching any post
+    last_modified, count = listing_version()
+    related = related_posts(id)
+
+    def render():
+        return render_template(
+            'post_detail.html',
+            post=db.session.get(Post, id),
+            related=related,
+            show_return_home=True,
+            show_sidebar=True
+        )
+
+    return conditional_page((id, row.updated_at, last_modified, count, related), last_modified, render)
+
+Feed = namedtuple('Feed', ['body', 'etag', 'last_modified'])
+
+FEED_MIMETYPES = {'atom': 'application/atom+xml', 'rss': 'application/rss+xml'}
+SITEMAP_PAGE_SIZE = 50000  # the sitemap protocol's limit of URLs per file
+
+
+def atom_date(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def site_url():
+    """Base for absolute links in cached documents: SITE_URL, or the request's host"""
+    return (app.config['SITE_URL'] or request.host_url).rstrip('/')
+
+
+def build_feed(fmt, category_id=None, base_url=''):
+    """Serialize the latest FEED_SIZE posts, optionally of one category, from their stored HTML"""
+    query = Post.query.options(db.joinedload(Post.user), db.lazyload(Post.tags), db.lazyload(Post.categories))
+    title = app.config['BLOG_TITLE']
+    page_url = base_url + url_for('home')
+    if category_id is not None:
+        category = db.get_or_404(Category, category_id)
+        query = query.filter(Post.categories.any(id=category.id))
+        title = f'{title}: {category.name}'
+        page_url = base_url + url_for('posts_by_category', category_id=category.id)
+    posts = query.order_by(Post.date_posted.desc(), Post.id.desc()).limit(app.config['FEED_SIZE']).all()
+    updated = max((post.updated_at or post.date_posted for post in posts), default=datetime(1970, 1, 1))
+    feed_url = base_url + request.script_root + request.path
+
+    if fmt == 'atom':
+        parts = [
+            '<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">',
+            f'<title>{xml_escape(title)}</title>',
+            f'<link href="{xml_escape(page_url)}"/>',
+            f'<link rel="self" href="{xml_escape(feed_url)}"/>',
+            f'<id>{xml_escape(feed_url)}</id>',
+            f'<updated>{atom_date(updated)}</updated>',
+        ]
+        for post in posts:
+            url = base_url + url_for('post_detail', id=post.id)
+            parts.append(
+                f'<entry><title>{xml_escape(post.title)}</title><link href="{xml_escape(url)}"/>'
+                f'<id>{xml_escape(url)}</id><published>{atom_date(post.date_posted)}</published>'
+                f'<updated>{atom_date(post.updated_at or post.date_posted)}</updated>'
+                f'<author><name>{xml_escape(post.user.username)}</name></author>'
+                f'<content type="html">{xml_escape(str(post.html))}</content></entry>'
+            )
+        parts.append('</feed>')
+    else:
+        parts = [
+            '<?xml version="1.0" encoding="utf-8"?>\n<rss version="2.0"><channel>',
+            f'<title>{xml_escape(title)}</title>',
+            f'<link>{xml_escape(page_url)}</link>',
+            f'<description>{xml_escape(title)}</description>',
+            f'<lastBuildDate>{format_datetime(updated.replace(tzinfo=timezone.utc), usegmt=True)}</lastBuildDate>',
+        ]
+        for post in posts:
+            url = base_url + url_for('post_detail', id=post.id)
+            parts.append(
+                f'<item><title>{xml_escape(post.title)}</title><link>{xml_escape(url)}</link>'
+                f'<guid isPermaLink="true">{xml_escape(url)}</guid>'
+                f'<pubDate>{format_datetime(post.date_posted.replace(tzinfo=timezone.utc), usegmt=True)}</pubDate>'
+                f'<description>{xml_escape(str(post.html))}</description></item>'
+            )
+        parts.append('</channel></rss>')
+
+    body = '\n'.join(parts).encode('utf-8')
+    # The newest entry dates the feed's content, but a deleted entry changes
+    # it too, so the header uses the post table's modification time
+    last_modified = listing_version()[0] or updated
+    return Feed(body, hashlib.sha256(body).hexdigest()[:32], last_modified.replace(microsecond=0, tzinfo=timezone.utc))
+
+
+def feed_response(fmt, category_id=None):
+    base_url = site_url()
+    key = (fmt, category_id, base_url)
+    with _feed_caches_lock:
+        cache = feed_caches.get(key)
+        if cache is not None:
+            feed_caches.move_to_end(key)
+    if cache is None:
+        # Only feeds that exist get an entry; the cached category list
+        # answers for most ids without a query
+        if category_id is not None and category_id not in {category.id for category in category_cache.get()}:
+            db.get_or_404(Category, category_id)
+        cache = CachedValue(lambda: build_feed(fmt, category_id, base_url), 'FEED_CACHE_TTL', 'feeds')
+        with _feed_caches_lock:
+            cache = feed_caches.setdefault(key, cache)
+            while len(feed_caches) > app.config['FEED_CACHE_ENTRIES']:
+                feed_caches.popitem(last=False)
+    feed = cache.get()
+    response = app.response_class(feed.body, mimetype=FEED_MIMETYPES[fmt])
+    response.set_etag(feed.etag)
+    response.last_modified = feed.last_modified
+    response.headers['Cache-Control'] = app.config['CACHE_CONTROL']['default']
+    return response.make_conditional(request)
+
+
+@app.route('/feed.atom')
+def feed_atom():
+    return feed_response('atom')
+
+
+@app.route('/feed.rss')
+def feed_rss():
+    return feed_response('rss')
+
+
+@app.route('/category/<int:category_id>/feed.atom')
+def category_feed_atom(category_id):
+    return feed_response('atom', category_id)
+
+
+@app.route('/category/<int:category_id>/feed.rss')
+def category_feed_rss(category_id):
+    return feed_response('rss', category_id)
+
+
+def sitemap_response(generate):
+    """Stream sitemap XML, answering revalidation from the post table version first"""
+    last_modified, count = listing_version()
+    etag = hashlib.sha256(repr((last_modified, count, category_cache.get(), request.path)).encode('utf-8')).hexdigest()[:32]
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(stream_with_context(generate(count)), mimetype='application/xml')
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+    response.headers['Cache-Control'] = app.config['CACHE_CONTROL']['default']
+    return response
 
-    # Use the markdown filter directly
-    return render_template(
-        'post_detail.html',
-        post=post,
-        show_return_home=True,
-        show_sidebar=True
-    )
 
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+def sitemap_urls(offset, limit):
+    """Yield <url> elements for one slice of the posts, fetching rows in batches"""
+    rows = db.session.query(Post.id, Post.updated_at).order_by(Post.id).offset(offset).limit(limit) \
+        .execution_options(yield_per=1000)
+    for post_id, updated_at in rows:
+        lastmod = f'<lastmod>{atom_date(updated_at)}</lastmod>' if updated_at else ''
+        yield f'<url><loc>{xml_escape(url_for("post_detail", id=post_id, _external=True))}</loc>{lastmod}</url>\n'
+
+
+def sitemap_urlset(page):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n'
+    yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    if page == 1:
+        yield f'<url><loc>{xml_escape(url_for("home", _external=True))}</loc></url>\n'
+        for category in category_cache.get():
+            loc = url_for('posts_by_category', category_id=category.id, _external=True)
+            yield f'<url><loc>{xml_escape(loc)}</loc></url>\n'
+    yield from sitemap_urls((page - 1) * SITEMAP_PAGE_SIZE, SITEMAP_PAGE_SIZE)
+    yield '</urlset>\n'
+
+
+def sitemap_document(count):
+    """The sitemap, or a sitemap index of SITEMAP_PAGE_SIZE pages once there are more posts"""
+    if count <= SITEMAP_PAGE_SIZE:
+        yield from sitemap_urlset(1)
+        return
+    yield '<?xml version="1.0" encoding="utf-8"?>\n'
+    yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for page in range(1, math.ceil(count / SITEMAP_PAGE_SIZE) + 1):
+        yield f'<sitemap><loc>{xml_escape(url_for("sitemap_page", page=page, _external=True))}</loc></sitemap>\n'
+    yield '</sitemapindex>\n'
+
+
+@app.route('/sitemap.xml')
+def sitemap():
+    return sitemap_response(sitemap_document)
+
+
+@app.route('/sitemap-<int:page>.xml')
+def sitemap_page(page):
+    return sitemap_response(lambda count: sitemap_urlset(page))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def store_upload(stream, max_bytes):
+    """
+    Copy an upload stream to UPLOAD_FOLDER in chunks while hashing it, and
+    store it as <sha256>.<ext> so identical images share one file. Returns
+    the stored filename and the image's width, or None when the data is not
+    an image Pillow can read or exceeds max_bytes.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    extension = None
+    tmp_path = os.path.join(UPLOAD_FOLDER, f'.upload-{os.getpid()}-{threading.get_ident()}.tmp')
+    try:
+        with open(tmp_path, 'wb') as tmp:
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if extension is None:
+                    extension = next((ext for signature, ext in IMAGE_SIGNATURES.items()
+                                      if chunk.startswith(signature)), None)
+                    if extension is None:
+                        return None
+                size += len(chunk)
+                if size > max_bytes:
+                    return None
+                digest.update(chunk)
+                tmp.write(chunk)
+        if extension is None:
+            return None
+        # Check the data before it gets a public name, so a rejected upload
+        # leaves nothing behind
+        try:
+            width = image_width(tmp_path)
+        except Exception as e:
+            app.logger.error(f"Error reading uploaded image: {str(e)}")
+            return None
+        filename = f'{digest.hexdigest()}.{extension}'
+        path = os.path.join(UPLOAD_FOLDER, filename)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        return filename, width
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def variant_name(filename, width, extension=None):
+    stem, original_extension = filename.rsplit('.', 1)
+    return f'{stem}-{width}.{extension or original_extension}'
+
+
+def generate_image_variants(folder, filename, widths, extensions=(None, 'webp')):
+    """
+    Write width-limited copies of an upload in its own format and as WebP.
+    Each copy is written on its own, so a format Pillow cannot save does not
+    stop the others; returns the errors of the copies that failed.
+    """
+    from PIL import Image
+
+    errors = []
+    source = os.path.join(folder, filename)
+    with Image.open(source) as image:
+        for width in widths:
+            for extension in extensions:
+                target = os.path.join(folder, variant_name(filename, width, extension))
+                if os.path.exists(target):
+                    continue
+                tmp_target = target + '.tmp'
+                try:
+                    resized = image.copy()
+                    resized.thumbnail((width, width * 10))
+                    if extension == 'webp' or resized.mode not in ('RGB', 'L', 'P', 'RGBA'):
+                        resized = resized.convert('RGBA' if 'A' in resized.getbands() else 'RGB')
+                    resized.save(tmp_target, format='WEBP' if extension else image.format, quality=82)
+                    os.replace(tmp_target, target)
+                except Exception as e:
+                    errors.append(f'{os.path.basename(target)}: {e}')
+                    if os.path.exists(tmp_target):
+                        os.remove(tmp_target)
+    return errors
+
+
+def log_variant_errors(filename, errors):
+    for error in errors:
+        app.logger.error(f'Error resizing {filename}: {error}')
+
+
+_variant_executor = None
+
+
+def schedule_image_variants(filename, widths):
+    global _variant_executor
+    args = (os.path.abspath(UPLOAD_FOLDER), filename, widths)
+    workers = app.config['UPLOAD_VARIANT_WORKERS']
+    if workers <= 0:
+        log_variant_errors(filename, generate_image_variants(*args))
+        return
+    if _variant_executor is None:
+        _variant_executor = ProcessPoolExecutor(max_workers=workers)
+    future = _variant_executor.submit(generate_image_variants, *args)
+    future.add_done_callback(
+        lambda f: log_variant_errors(filename, [f.exception()] if f.exception() else f.result()))
+
+
+def image_width(path):
+    from PIL import Image
+
+    with Image.open(path) as image:
+        return image.width
+
+
+@app.errorhandler(413)
+def request_too_large(error):
+    if request.path == url_for('upload_image'):
+        return jsonify({'error': 'File too large'}), 413
+    return error
+
+
 @app.route('/upload-image', methods=['POST'])
 @login_required
 def upload_image():
@@ -298,54 +1936,415 @@ def upload_image():
         return jsonify({'error': 'No file selected'}), 400
 
     if file and allowed_file(file.filename):
-        filename = secure_filename(f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{file.filename}")
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        return jsonify({'url': url_for('static', filename=f'uploads/{filename}')})
+        stored = store_upload(file.stream, app.config['MAX_CONTENT_LENGTH'])
+        if stored is None:
+            return jsonify({'error': 'Invalid or oversized image'}), 400
+        filename, original_width = stored
+
+        thumbnail_width, content_width = app.config['UPLOAD_VARIANT_WIDTHS']
+        widths = tuple(width for width in app.config['UPLOAD_VARIANT_WIDTHS'] if width < original_width)
+        # The editor inserts content_url into the post right away, so that copy
+        # is written here; the rest are left to the worker pool
+        if content_width in widths:
+            log_variant_errors(filename, generate_image_variants(
+                os.path.abspath(UPLOAD_FOLDER), filename, (content_width,), extensions=(None,)))
+        if widths:
+            schedule_image_variants(filename, widths)
+
+        def upload_url(name):
+            return url_for('static', filename=f'uploads/{name}')
+
+        def variant_urls(extension=None):
+            """URLs of the variants already on disk, by width"""
+            names = {width: variant_name(filename, width, extension) for width in widths}
+            return {width: upload_url(name) for width, name in names.items()
+                    if os.path.exists(os.path.join(UPLOAD_FOLDER, name))}
+
+        variants, webp_variants = variant_urls(), variant_urls('webp')
+        return jsonify({
+            'url': upload_url(filename),
+            'content_url': variants.get(content_width, upload_url(filename)),
+            'thumbnail_url': variants.get(thumbnail_width, upload_url(filename)),
+            'width': original_width,
+            'srcset': ', '.join(
+                [f'{url} {width}w' for width, url in variants.items()]
+                + [f'{upload_url(filename)} {original_width}w']
+            ),
+            'webp_srcset': ', '.join(f'{url} {width}w' for width, url in webp_variants.items()),
+        })
 
     return jsonify({'error': 'Invalid file type'}), 400
 
 
-@app.route('/save-draft', methods=['POST'])
-@login_required
-def save_draft():
-    data = request.get_json()
+# Autosave buffers: the latest draft state per user id, written to the Draft
+# table at most once per DRAFT_FLUSH_INTERVAL. Another worker process only
+# sees flushed state, and answers version mismatches with 409.
+DRAFT_FIELDS = ('title', 'content', 'tags', 'categories')
+_draft_buffers = {}
+_draft_lock = threading.Lock()
+# Held while a user's draft is written or discarded, so the flusher thread and
+# request threads never write the same user's row at once
+_draft_flush_locks = defaultdict(threading.Lock)
+_draft_flusher = None
+
+
+def draft_state(user_id):
+    """Latest draft of a user: the in-memory buffer if any, otherwise the stored row"""
+    state = _draft_buffers.get(user_id)
+    # With write-through saves (interval 0, as under several server workers)
+    # the stored row is authoritative; another worker may have saved since
+    if state is not None and (state['dirty'] or app.config['DRAFT_FLUSH_INTERVAL'] > 0):
+        return state
+    draft = Draft.query.filter_by(user_id=user_id).first()
+    if draft is None:
+        return None
+    return {
+        'title': draft.title or '',
+        'content': draft.content or '',
+        'tags': json.loads(draft.tags) if draft.tags else [],
+        'categories': draft.categories or '',
+        'version': draft.version or 0,
+        'updated_at': draft.updated_at,
+        'dirty': False,
+        'flushed_at': time.monotonic(),
+    }
 
-    draft = Draft.query.filter_by(user_id=current_user.id).first()
-    if not draft:
-        draft = Draft(user_id=current_user.id)
 
-    draft.title = data.get('title', '')
-    draft.content = data.get('content', '')
-    draft.tags = json.dumps(data.get('tags', []))
-    draft.categories = data.get('categories', '')
+def apply_draft_changes(state, data):
+    """
+    Return the draft after applying `data`, or None when nothing changed.
+
+    Fields may be sent whole, and content may instead be sent as
+    content_delta = {start, end, text}: replace content[start:end] of the
+    client's base version with text.
+    """
+    updated = dict(state)
+    for field in DRAFT_FIELDS:
+        if field in data:
+            updated[field] = data[field] if data[field] is not None else ''
+    delta = data.get('content_delta')
+    if delta is not None:
+        if not isinstance(delta, dict):
+            raise ValueError('content_delta must be an object')
+        start, end, text = delta.get('start'), delta.get('end'), delta.get('text', '')
+        content = state['content']
+        if not (isinstance(start, int) and isinstance(end, int) and 0 <= start <= end <= len(content)):
+            raise ValueError('content_delta is out of range')
+        if not isinstance(text, str):
+            raise ValueError('content_delta text must be a string')
+        updated['content'] = content[:start] + text + content[end:]
+    if all(updated[field] == state[field] for field in DRAFT_FIELDS):
+        return None
+    return updated
+
+
+def flush_draft(user_id):
+    """Write a user's buffered draft to the database if it has unsaved changes"""
+    with draft_flush_lock(user_id):
+        # Taken under the flush lock: a buffer discarded before this point
+        # (the draft was published) is not written back
+        with _draft_lock:
+            state = _draft_buffers.get(user_id)
+            if state is None or not state['dirty']:
+                return
+            snapshot = dict(state)
+
+        draft = Draft.query.filter_by(user_id=user_id).first() or Draft(user_id=user_id)
+        draft.title = snapshot['title']
+        draft.content = snapshot['content']
+        draft.tags = json.dumps(snapshot['tags'])
+        draft.categories = snapshot['categories']
+        draft.version = snapshot['version']
+        db.session.add(draft)
+        db.session.commit()
+
+        with _draft_lock:
+            state = _draft_buffers.get(user_id)
+            if state is not None and state['version'] == snapshot['version']:
+                state['dirty'] = False
+                state['flushed_at'] = time.monotonic()
 
-    db.session.add(draft)
-    db.session.commit()
 
-    return jsonify({
-        'message': 'Draft saved successfully',
-        'updated_at': draft.updated_at.isoformat()
-    })
+def draft_flush_lock(user_id):
+    with _draft_lock:
+        return _draft_flush_locks[user_id]
+
+
+def flush_drafts(force=False):
+    interval = app.config['DRAFT_FLUSH_INTERVAL']
+    now = time.monotonic()
+    with _draft_lock:
+        due = [user_id for user_id, state in _draft_buffers.items()
+               if state['dirty'] and (force or now - state['flushed_at'] >= interval)]
+    for user_id in due:
+        try:
+            flush_draft(user_id)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error saving draft of user {user_id}: {str(e)}")
+
+
+def _run_draft_flusher():
+    while True:
+        time.sleep(max(app.config['DRAFT_FLUSH_INTERVAL'], 0.1))
+        with app.app_context():
+            flush_drafts()
+
+
+def start_draft_flusher():
+    global _draft_flusher
+    with _draft_lock:
+        if _draft_flusher is None:
+            _draft_flusher = threading.Thread(target=_run_draft_flusher, name='draft-flusher', daemon=True)
+            _draft_flusher.start()
+
+
+def discard_draft(user_id):
+    # Waits for a flush in progress, which would otherwise re-create the row
+    # the caller is about to delete
+    with draft_flush_lock(user_id), _draft_lock:
+        _draft_buffers.pop(user_id, None)
+
+
+@atexit.register
+def _flush_drafts_at_exit():
+    if any(state['dirty'] for state in list(_draft_buffers.values())):
+        with app.app_context():
+            flush_drafts(force=True)
+
+
+def draft_response(state, status=200, **extra):
+    body = dict(extra, version=state['version'], updated_at=state['updated_at'].isoformat())
+    response = make_response(jsonify(body), status)
+    response.set_etag(str(state['version']))
+    return response
+
+
+@app.route('/save-draft', methods=['POST'])
+@login_required
+def save_draft():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    user_id = current_user.id
+    base_version = data.get('version')
+    if base_version is None and request.if_match and not request.if_match.star_tag:
+        base_version = next(iter(request.if_match.as_set()), None)
+    if base_version is not None:
+        try:
+            base_version = int(base_version)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'version must be an integer'}), 400
+
+    with _draft_lock:
+        state = draft_state(user_id) or {
+            'title': '', 'content': '', 'tags': [], 'categories': '', 'version': 0,
+            'updated_at': datetime.utcnow(), 'dirty': False, 'flushed_at': float('-inf'),
+        }
+        if base_version is not None and base_version != state['version']:
+            # Another editor saved in between; the client rebases on this state
+            return draft_response(state, 409, error='Draft was changed elsewhere',
+                                  draft={field: state[field] for field in DRAFT_FIELDS})
+        try:
+            updated = apply_draft_changes(state, data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if updated is None:
+            _draft_buffers[user_id] = state
+            return draft_response(state, message='Draft unchanged')
+        updated.update(version=state['version'] + 1, updated_at=datetime.utcnow(), dirty=True)
+        _draft_buffers[user_id] = updated
+        flush_now = time.monotonic() - updated['flushed_at'] >= app.config['DRAFT_FLUSH_INTERVAL']
+
+    if flush_now:
+        flush_draft(user_id)
+    else:
+        start_draft_flusher()
+    return draft_response(updated, message='Draft saved successfully')
 
 
 @app.route('/load-draft')
 @login_required
 def load_draft():
-    draft = Draft.query.filter_by(user_id=current_user.id).first()
-    if draft:
-        return jsonify({
-            'draft': {
-                'title': draft.title,
-                'content': draft.content,
-                'tags': json.loads(draft.tags),
-                'categories': draft.categories,
-                'updated_at': draft.updated_at.isoformat()
-            }
+    state = draft_state(current_user.id)
+    if state:
+        return draft_response(state, draft={
+            'title': state['title'],
+            'content': state['content'],
+            'tags': state['tags'],
+            'categories': state['categories'],
+            'version': state['version'],
+            'updated_at': state['updated_at'].isoformat()
         })
     return jsonify({'draft': None})
 
 
+# Background jobs. Writes enqueue jobs in the same transaction as the post
+# row, so work survives restarts; runner threads claim due jobs with an
+# atomic UPDATE, which keeps several worker processes from running one twice.
+JOB_HANDLERS = {}
+# Jobs enqueued by post_changed() for every created, edited or deleted post
+POST_CHANGE_JOBS = ['render_post', 'index_post', 'relate_post']
+_job_wakeup = threading.Event()
+_job_runners = []
+_job_runners_lock = threading.Lock()
+
+
+def job_handler(kind):
+    """Register `function(post_id)` as the handler of jobs of `kind`"""
+    def register(function):
+        JOB_HANDLERS[kind] = function
+        return function
+    return register
+
+
+@job_handler('render_post')
+def render_post_job(post_id):
+    post = db.session.get(Post, post_id)
+    if post is not None and not post.is_rendered():
+        post.render()
+        db.session.commit()
+        content_changed()
+
+
+@job_handler('index_post')
+def index_post_job(post_id):
+    if db.session.get(Post, post_id) is None:
+        unindex_post(post_id)
+    else:
+        index_posts([post_id])
+    db.session.commit()
+
+
+@job_handler('relate_post')
+def relate_post_job(post_id):
+    update_related_posts(post_id)
+    db.session.commit()
+
+
+def enqueue_job(kind, post_id=None):
+    """Add a pending job in the current transaction, unless one is already pending for this post"""
+    values = {'kind': kind, 'post_id': post_id, 'status': 'pending', 'attempts': 0,
+              'run_after': datetime.utcnow(), 'created_at': datetime.utcnow()}
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql') and post_id is not None:
+        insert = dialect_insert(dialect)
+        db.session.execute(insert(Job.__table__).values(**values).on_conflict_do_nothing(
+            index_elements=['kind', 'post_id'], index_where=Job.status == 'pending'))
+    elif not Job.query.filter_by(kind=kind, post_id=post_id, status='pending').first():
+        db.session.add(Job(**values))
+
+
+def post_changed(post_id, tag_ids=()):
+    """
+    Hook for created, edited and deleted posts: recount the tags the post had
+    or has (`tag_ids`) and queue the rest of its derived work.
+    """
+    refresh_tag_counts(tag_ids)
+    for kind in POST_CHANGE_JOBS:
+        enqueue_job(kind, post_id)
+
+
+def claim_job():
+    """Mark the next due job as running and return it, or None"""
+    now = datetime.utcnow()
+    due = db.or_(
+        db.and_(Job.status == 'pending', Job.run_after <= now),
+        db.and_(Job.status == 'running', Job.locked_until < now),
+    )
+    while True:
+        job_id = db.session.execute(
+            db.select(Job.id).where(due).order_by(Job.run_after, Job.id).limit(1)
+        ).scalar()
+        if job_id is None:
+            db.session.commit()
+            return None
+        claimed = db.session.execute(db.update(Job).where(Job.id == job_id, due).values(
+            status='running', locked_until=now + timedelta(seconds=app.config['JOB_LOCK_TIMEOUT'])
+        ).execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+
+
+def run_job(job):
+    """Run a claimed job; delete it on success, otherwise retry with backoff or mark it failed"""
+    try:
+        handler = JOB_HANDLERS.get(job.kind)
+        if handler is None:
+            raise LookupError(f'No handler for job kind {job.kind!r}')
+        handler(job.post_id)
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job.id)
+        job.attempts += 1
+        job.last_error = f'{type(e).__name__}: {e}'
+        job.locked_until = None
+        app.logger.error(f'Job {job.kind} for post {job.post_id} failed (attempt {job.attempts}): {e}')
+        if job.attempts >= app.config['JOB_MAX_ATTEMPTS']:
+            job.status = 'failed'
+        elif Job.query.filter_by(kind=job.kind, post_id=job.post_id, status='pending').first():
+            # A newer pending job for the same post supersedes this retry
+            db.session.delete(job)
+        else:
+            job.status = 'pending'
+            job.run_after = datetime.utcnow() + timedelta(
+                seconds=app.config['JOB_RETRY_DELAY'] * 2 ** (job.attempts - 1))
+        db.session.commit()
+        return False
+    db.session.execute(db.delete(Job).where(Job.id == job.id))
+    db.session.commit()
+    return True
+
+
+def run_due_jobs(limit=None):
+    """Run due jobs until none are left (or `limit` ran) and return how many ran"""
+    ran = 0
+    while limit is None or ran < limit:
+        job = claim_job()
+        if job is None:
+            break
+        run_job(job)
+        ran += 1
+    return ran
+
+
+def _run_job_runner():
+    while True:
+        _job_wakeup.wait(app.config['JOB_POLL_INTERVAL'])
+        _job_wakeup.clear()
+        with app.app_context():
+            try:
+                run_due_jobs()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f'Job runner error: {e}')
+
+
+def start_job_runners():
+    with _job_runners_lock:
+        while len(_job_runners) < app.config['JOB_WORKERS']:
+            runner = threading.Thread(target=_run_job_runner, name=f'job-runner-{len(_job_runners)}', daemon=True)
+            runner.start()
+            _job_runners.append(runner)
+
+
+def dispatch_jobs():
+    """Call after committing enqueued jobs: run them inline or wake the runner threads"""
+    if app.config['JOB_WORKERS'] <= 0:
+        run_due_jobs()
+        return
+    start_job_runners()
+    _job_wakeup.set()
+
+
+@app.before_request
+def resume_pending_jobs():
+    """Start the runners on the first request so jobs left by a restart are picked up"""
+    if not _job_runners and app.config['JOB_WORKERS'] > 0:
+        start_job_runners()
+
+
 @app.route('/new', methods=['GET', 'POST'])
 @login_required
 def new_post():
@@ -367,34 +2366,25 @@ def new_post():
 
                 # Handle tags
                 if data.get('tags'):
-                    for tag_data in json.loads(data['tags']) if isinstance(data['tags'], str) else data['tags']:
-                        tag_name = tag_data.get('value', '').strip()
-                        if tag_name:
-                            tag = Tag.query.filter_by(name=tag_name).first()
-                            if not tag:
-                                tag = Tag(name=tag_name)
-                                db.session.add(tag)
-                            post.tags.append(tag)
+                    tag_data = json.loads(data['tags']) if isinstance(data['tags'], str) else data['tags']
+                    post.tags = resolve_names(Tag, [tag.get('value', '') for tag in tag_data])
 
                 # Handle categories
                 if data.get('categories'):
-                    category_names = [cat.strip() for cat in data['categories'].split(',')]
-                    for cat_name in category_names:
-                        if cat_name:
-                            category = Category.query.filter_by(name=cat_name).first()
-                            if not category:
-                                category = Category(name=cat_name)
-                                db.session.add(category)
-                            post.categories.append(category)
+                    post.categories = resolve_names(Category, data['categories'].split(','))
 
                 db.session.add(post)
 
                 # Delete draft if exists
-                draft = Draft.query.filter_by(user_id=current_user.id).first()
-                if draft:
+                discard_draft(current_user.id)
+                for draft in Draft.query.filter_by(user_id=current_user.id):
                     db.session.delete(draft)
 
+                db.session.flush()
+                post_changed(post.id, [tag.id for tag in post.tags])
                 db.session.commit()
+                content_changed()
+                dispatch_jobs()
 
                 return jsonify({
                     'message': 'Post created successfully',
@@ -417,28 +2407,18 @@ def new_post():
 
                 # Handle tags
                 if form.tags.data:
-                    tag_names = [t.strip() for t in form.tags.data.split(',')]
-                    for tag_name in tag_names:
-                        if tag_name:
-                            tag = Tag.query.filter_by(name=tag_name).first()
-                            if not tag:
-                                tag = Tag(name=tag_name)
-                                db.session.add(tag)
-                            post.tags.append(tag)
+                    post.tags = resolve_names(Tag, form.tags.data.split(','))
 
                 # Handle categories
                 if form.categories.data:
-                    category_names = [cat.strip() for cat in form.categories.data.split(',')]
-                    for cat_name in category_names:
-                        if cat_name:
-                            category = Category.query.filter_by(name=cat_name).first()
-                            if not category:
-                                category = Category(name=cat_name)
-                                db.session.add(category)
-                            post.categories.append(category)
+                    post.categories = resolve_names(Category, form.categories.data.split(','))
 
                 db.session.add(post)
+                db.session.flush()
+                post_changed(post.id, [tag.id for tag in post.tags])
                 db.session.commit()
+                content_changed()
+                dispatch_jobs()
                 flash('Post created successfully!', 'success')
                 return redirect(url_for('home'))
 
@@ -465,29 +2445,16 @@ def edit_post(id):
     if form.validate_on_submit():
         post.title = form.title.data
         post.content = form.content.data
+        post.updated_at = datetime.utcnow()
         tag_names = [tag['value'] for tag in json.loads(request.form['tags'])] if request.form['tags'] else []
-        tags = []
-        for name in tag_names:
-            tag_name = name.strip()
-            if tag_name:
-                tag = Tag.query.filter_by(name=tag_name).first()
-                if not tag:
-                    tag = Tag(name=tag_name)
-                    db.session.add(tag)
-                tags.append(tag)
-        category_names = [category.strip() for category in form.categories.data.split(',')] if form.categories.data else []
-        categories = []
-        for name in category_names:
-            if name:
-                category = Category.query.filter_by(name=name).first()
-                if not category:
-                    category = Category(name=name)
-                    db.session.add(category)
-                categories.append(category)
-        post.tags = tags
-        post.categories = categories
+        tag_ids = [tag.id for tag in post.tags]
+        post.tags = resolve_names(Tag, tag_names)
+        post.categories = resolve_names(Category, form.categories.data.split(',') if form.categories.data else [])
         try:
+            post_changed(post.id, tag_ids + [tag.id for tag in post.tags])
             db.session.commit()
+            content_changed()
+            dispatch_jobs()
             return redirect('/')
         except Exception as e:
             print(e)
@@ -498,26 +2465,188 @@ def edit_post(id):
 @app.route('/search', methods=['GET'])
 def search():
     query = escape(request.args.get('query', ''))
-    if query:
+    snippets = {}
+    if query and search_index_enabled():
+        page, snippets = search_posts(request.args.get('query', ''))
+    elif query:
         search_pattern = f"%{query}%"
-        posts = Post.query.filter(
+        page = paginate_posts(Post.query.options(*SEARCH_LOAD_OPTIONS).filter(
             db.or_(
                 Post.title.like(search_pattern),
                 Post.content.like(search_pattern),
                 Post.tags.any(Tag.name.like(search_pattern)),
                 Post.categories.any(Category.name.like(search_pattern))
             )
-        ).order_by(Post.date_posted.desc()).all()
+        ))
     else:
-        posts = Post.query.order_by(Post.date_posted.desc()).all()
+        page = paginate_posts(Post.query.options(*SEARCH_LOAD_OPTIONS))
 
     return render_template(
         'search_results.html',
-        posts=posts,
+        posts=page.posts,
+        page=page,
+        snippets=snippets,
         query=query,
         show_return_home=True,
         show_sidebar=True
     )
+
+
+# Read-only JSON API. Post queries select only the columns behind the
+# requested fields; tags and categories are fetched per page with one IN query each.
+POST_API_COLUMNS = {
+    'id': Post.id,
+    'title': Post.title,
+    'content': Post.content,
+    'content_html': Post.content_html,
+    'excerpt_html': Post.excerpt_html,
+    'date_posted': Post.date_posted,
+    'updated_at': Post.updated_at,
+    'author': User.username,
+}
+# Stored HTML columns, and how to render them while they are missing
+POST_API_RENDERED = {
+    'content_html': lambda content: markdown_to_html(content),
+    'excerpt_html': lambda content: markdown_to_html(split_excerpt(content)[0]),
+}
+POST_API_RELATIONS = {
+    'tags': (post_tags.c.post_id, post_tags.c.tag_id, Tag),
+    'categories': (post_categories.c.post_id, post_categories.c.category_id, Category),
+}
+POST_API_LIST_FIELDS = ('id', 'title', 'excerpt_html', 'date_posted', 'updated_at', 'author', 'tags', 'categories')
+POST_API_DETAIL_FIELDS = ('id', 'title', 'content', 'date_posted', 'updated_at', 'author', 'tags', 'categories')
+API_MAX_LIMIT = 100
+API_STREAM_BATCH = 500
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+@app.errorhandler(ApiError)
+def handle_api_error(error):
+    return jsonify({'error': str(error)}), error.status
+
+
+def api_dumps(value):
+    return json.dumps(value, separators=(',', ':'), default=lambda v: v.isoformat())
+
+
+def api_fields(default):
+    """Fields from ?fields=a,b (or the default), plus content_html when ?html=1"""
+    requested = request.args.get('fields')
+    fields = [field.strip() for field in requested.split(',') if field.strip()] if requested else list(default)
+    if request.args.get('html') in ('1', 'true') and 'content_html' not in fields:
+        fields.append('content_html')
+    unknown = [field for field in fields if field not in POST_API_COLUMNS and field not in POST_API_RELATIONS]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def api_post_query(fields):
+    columns = [POST_API_COLUMNS[field].label(field) for field in fields if field in POST_API_COLUMNS]
+    # The cursor needs id and date_posted even when they are not returned
+    for field in ('id', 'date_posted'):
+        if field not in fields:
+            columns.append(POST_API_COLUMNS[field].label(field))
+    query = db.session.query(*columns).select_from(Post)
+    if 'author' in fields:
+        query = query.join(User, User.id == Post.user_id)
+    return query
+
+
+def api_serialize_posts(rows, fields):
+    """Turn rows of api_post_query() into dicts, adding tag and category names in one query each"""
+    ids = [row.id for row in rows]
+    related = {}
+    for field, (post_column, target_column, model) in POST_API_RELATIONS.items():
+        if field in fields:
+            names = defaultdict(list)
+            if ids:
+                for post_id, name in db.session.query(post_column, model.name) \
+                        .join(model, model.id == target_column).filter(post_column.in_(ids)).order_by(model.name):
+                    names[post_id].append(name)
+            related[field] = names
+    # Stored HTML is cleared when a post is edited; until the render job runs,
+    # render on the fly from content fetched for just those posts
+    html_fields = [field for field in fields if field in POST_API_RENDERED]
+    pending = [row.id for row in rows if any(getattr(row, field) is None for field in html_fields)]
+    sources = dict(db.session.query(Post.id, Post.content).filter(Post.id.in_(pending))) if pending else {}
+
+    def value(row, field):
+        if field in related:
+            return related[field][row.id]
+        if field in POST_API_RENDERED:
+            stored = getattr(row, field)
+            record_cache('markdown', stored is not None)
+            return stored if stored is not None else str(POST_API_RENDERED[field](sources[row.id]))
+        return getattr(row, field)
+
+    return [{field: value(row, field) for field in fields} for row in rows]
+
+
+def api_post_filter(query):
+    category_id = request.args.get('category', type=int)
+    if category_id is not None:
+        query = query.filter(Post.categories.any(id=category_id))
+    tag = request.args.get('tag')
+    if tag:
+        query = query.filter(Post.tags.any(name=tag))
+    return query
+
+
+@app.route('/api/v1/posts')
+def api_posts():
+    fields = api_fields(POST_API_LIST_FIELDS)
+    query = api_post_filter(api_post_query(fields))
+
+    if request.args.get('stream') in ('1', 'true'):
+        # Whole-archive export: rows are fetched and serialized in batches
+        def generate():
+            yield '{"posts":['
+            rows = iter(query.order_by(Post.date_posted.desc(), Post.id.desc())
+                        .execution_options(yield_per=API_STREAM_BATCH))
+            first = True
+            for batch in iter(lambda: list(islice(rows, API_STREAM_BATCH)), []):
+                for post in api_serialize_posts(batch, fields):
+                    yield ('' if first else ',') + api_dumps(post)
+                    first = False
+            yield ']}'
+
+        return app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+    limit = min(max(request.args.get('limit', app.config['POSTS_PER_PAGE'], type=int), 1), API_MAX_LIMIT)
+    page = paginate_posts(query, per_page=limit)
+    body = {
+        'posts': api_serialize_posts(page.posts, fields),
+        'links': {'older': page.older_url, 'newer': page.newer_url},
+    }
+    return app.response_class(api_dumps(body), mimetype='application/json')
+
+
+@app.route('/api/v1/posts/<int:id>')
+def api_post(id):
+    fields = api_fields(POST_API_DETAIL_FIELDS)
+    row = api_post_query(fields).filter(Post.id == id).first()
+    if row is None:
+        raise ApiError('Post not found', 404)
+    return app.response_class(api_dumps(api_serialize_posts([row], fields)[0]), mimetype='application/json')
+
+
+@app.route('/api/v1/categories')
+def api_categories():
+    categories = [category._asdict() for category in category_cache.get()]
+    return app.response_class(api_dumps({'categories': categories}), mimetype='application/json')
+
+
+@app.route('/api/v1/tags')
+def api_tags():
+    return app.response_class(api_dumps({'tags': list(tag_cache.get())}), mimetype='application/json')
+
+
 @app.route('/delete/<int:id>')
 @login_required
 def delete_post(id):
@@ -528,21 +2657,596 @@ def delete_post(id):
         flash('You are not authorized to delete this post', 'danger')
         return redirect(url_for('home'))
     try:
+        tag_ids = [tag.id for tag in post.tags]
         db.session.delete(post)
+        record_post_deletion()
+        post_changed(post.id, tag_ids)
         db.session.commit()
+        content_changed()
+        dispatch_jobs()
         return redirect('/')
     except Exception as e:
         print(e)
         return 'There was an issue deleting your post'
 
+# Static export: every public page is written as <url path>.html, so a web
+# server can serve it with e.g. nginx `try_files $uri $uri.html $uri/index.html`.
+# Feeds and sitemaps keep their own file names.
+EXPORT_MANIFEST = '.export-manifest.json'
+EXPORT_RAW_EXTENSIONS = ('.atom', '.rss', '.xml')
+
+ExportPage = namedtuple('ExportPage', ['path', 'url', 'kind', 'args', 'version'])
+
+
+def export_file_path(url):
+    if url.endswith(EXPORT_RAW_EXTENSIONS):
+        return url.strip('/')
+    return 'index.html' if url == '/' else url.strip('/') + '.html'
+
+
+def export_pages():
+    """
+    List every page of the static site with a version string that changes
+    whenever the rendered page would, without rendering anything.
+    """
+    tags = defaultdict(list)
+    for post_id, name in db.session.query(post_tags.c.post_id, Tag.name).join(Tag, Tag.id == post_tags.c.tag_id):
+        tags[post_id].append(name)
+    categories = defaultdict(list)
+    for post_id, category_id, name in db.session.query(
+            post_categories.c.post_id, Category.id, Category.name).join(
+            Category, Category.id == post_categories.c.category_id):
+        categories[post_id].append((category_id, name))
+
+    templates_digest = hashlib.sha256()
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    for name in sorted(os.listdir(template_dir)):
+        with open(os.path.join(template_dir, name), 'rb') as f:
+            templates_digest.update(f.read())
+    site_version = repr((RENDERER_FINGERPRINT, templates_digest.hexdigest(), category_cache.get(),
+                         tag_cloud_cache.get()))
+    related = defaultdict(list)
+    for post_id, related_id, title in db.session.query(related_post.c.post_id, Post.id, Post.title) \
+            .join(Post, Post.id == related_post.c.related_id) \
+            .order_by(related_post.c.score.desc(), related_post.c.related_id.desc()):
+        related[post_id].append((related_id, title))
+
+    per_page = app.config['POSTS_PER_PAGE']
+    post_versions = {}
+    ordered_ids = []
+    rows = db.session.query(Post.id, Post.updated_at, Post.content_hash, Post.user_id) \
+        .order_by(Post.date_posted.desc(), Post.id.desc())
+    for post_id, updated_at, content_hash, user_id in rows:
+        post_versions[post_id] = repr((post_id, updated_at, content_hash, user_id,
+                                       sorted(tags[post_id]), sorted(categories[post_id]), related[post_id]))
+        ordered_ids.append(post_id)
+
+    pages = []
+
+    def add(url, kind, args, version):
+        version = hashlib.sha256(repr((site_version, kind, args, version)).encode('utf-8')).hexdigest()
+        pages.append(ExportPage(export_file_path(url), url, kind, args, version))
+
+    def add_listing(ids, first_url, page_url, kind, extra):
+        chunks = [ids[i:i + per_page] for i in range(0, len(ids), per_page)] or [[]]
+        urls = [first_url] + [page_url(number) for number in range(2, len(chunks) + 1)]
+        for number, chunk in enumerate(chunks):
+            newer_url = urls[number - 1] if number > 0 else None
+            older_url = urls[number + 1] if number + 1 < len(urls) else None
+            args = dict(extra, ids=chunk, older_url=older_url, newer_url=newer_url)
+            add(urls[number], kind, args, [post_versions[post_id] for post_id in chunk])
+
+    with app.test_request_context():
+        for post_id in ordered_ids:
+            add(url_for('post_detail', id=post_id), 'post', {'id': post_id}, post_versions[post_id])
+
+        add_listing(ordered_ids, url_for('home'), lambda number: f'/page/{number}', 'home', {})
+
+        for category in category_cache.get():
+            category_ids = [post_id for post_id in ordered_ids
+                            if category.id in (c[0] for c in categories[post_id])]
+            first_url = url_for('posts_by_category', category_id=category.id)
+            add_listing(category_ids, first_url, lambda number, base=first_url: f'{base}/page/{number}',
+                        'category', {'category_id': category.id})
+
+        # Feeds and sitemaps hold absolute links, so they also depend on SITE_URL
+        feed_size = app.config['FEED_SIZE']
+        feeds = [(None, ordered_ids)] + [
+            (category.id, [post_id for post_id in ordered_ids if category.id in (c[0] for c in categories[post_id])])
+            for category in category_cache.get()]
+        for category_id, ids in feeds:
+            for fmt, endpoint in (('atom', 'feed_atom'), ('rss', 'feed_rss')):
+                url = url_for(endpoint) if category_id is None else url_for(
+                    f'category_{endpoint}', category_id=category_id)
+                add(url, 'feed', {'fmt': fmt, 'category_id': category_id},
+                    (app.config['SITE_URL'], [post_versions[post_id] for post_id in ids[:feed_size]]))
+
+        sitemap_version = (app.config['SITE_URL'], sorted(post_versions.values()))
+        add(url_for('sitemap'), 'sitemap', {'count': len(ordered_ids)}, sitemap_version)
+        if len(ordered_ids) > SITEMAP_PAGE_SIZE:
+            for number in range(1, math.ceil(len(ordered_ids) / SITEMAP_PAGE_SIZE) + 1):
+                add(url_for('sitemap_page', page=number), 'sitemap_page', {'page': number}, sitemap_version)
+    return pages
+
+
+def render_export_page(page):
+    """Render one ExportPage the way its route would for an anonymous visitor"""
+    with app.test_request_context(page.url, base_url=app.config['SITE_URL']):
+        if page.kind == 'feed':
+            html_page = build_feed(page.args['fmt'], page.args['category_id'], site_url()).body.decode('utf-8')
+        elif page.kind == 'sitemap':
+            html_page = ''.join(sitemap_document(page.args['count']))
+        elif page.kind == 'sitemap_page':
+            html_page = ''.join(sitemap_urlset(page.args['page']))
+        elif page.kind == 'post':
+            html_page = render_template('post_detail.html', post=db.session.get(Post, page.args['id']),
+                                        related=related_posts(page.args['id']), show_return_home=True,
+                                        show_sidebar=True)
+        else:
+            ids = page.args['ids']
+            by_id = {post.id: post for post in Post.query.options(*LISTING_LOAD_OPTIONS).filter(Post.id.in_(ids))}
+            listing = PostPage([by_id[post_id] for post_id in ids if post_id in by_id],
+                               page.args['older_url'], page.args['newer_url'])
+            if page.kind == 'home':
+                html_page = render_template('home.html', posts=listing.posts, page=listing, show_sidebar=True)
+            else:
+                html_page = render_template('posts_by_category.html', posts=listing.posts, page=listing,
+                                            category=db.session.get(Category, page.args['category_id']))
+    db.session.remove()
+    return html_page
+
+
+def _export_worker_init():
+    # Each worker process keeps an app context and opens its own connections
+    app.app_context().push()
+    db.engine.dispose(close=False)
+
+
+def _export_worker(job):
+    output, page = job
+    write_export_file(os.path.join(output, page.path), render_export_page(page))
+    return page.path
+
+
+def write_export_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def copy_static_tree(source, destination):
+    """Copy files that are missing or differ in size or mtime; return the number copied"""
+    copied = 0
+    for root, _, files in os.walk(source):
+        target_root = os.path.join(destination, os.path.relpath(root, source))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            src = os.path.join(root, name)
+            dst = os.path.join(target_root, name)
+            src_stat = os.stat(src)
+            if os.path.exists(dst):
+                dst_stat = os.stat(dst)
+                if dst_stat.st_size == src_stat.st_size and int(dst_stat.st_mtime) == int(src_stat.st_mtime):
+                    continue
+            shutil.copy2(src, dst)
+            copied += 1
+    return copied
+
+
+def export_site(output, jobs=1, full=False):
+    """
+    Write the public site to `output`, rendering only pages whose version
+    changed since the last export. Returns (rendered, removed, unchanged).
+    """
+    manifest_path = os.path.join(output, EXPORT_MANIFEST)
+    manifest = {}
+    if not full and os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    pages = export_pages()
+    stale = [page for page in pages
+             if manifest.get(page.path) != page.version or not os.path.exists(os.path.join(output, page.path))]
+    current_paths = {page.path for page in pages}
+    removed = [path for path in manifest if path not in current_paths]
+
+    os.makedirs(output, exist_ok=True)
+    if jobs > 1 and len(stale) > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_export_worker_init) as executor:
+            list(executor.map(_export_worker, [(output, page) for page in stale], chunksize=16))
+    else:
+        for page in stale:
+            write_export_file(os.path.join(output, page.path), render_export_page(page))
+
+    for path in removed:
+        if os.path.exists(os.path.join(output, path)):
+            os.remove(os.path.join(output, path))
+
+    copy_static_tree(app.static_folder, os.path.join(output, app.static_url_path.strip('/')))
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({page.path: page.version for page in pages}, f, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return len(stale), len(removed), len(pages) - len(stale)
+
+
+# Bulk import of markdown files with front matter, or of JSONL dumps
+FRONT_MATTER_DELIMITER = '---'
+
+
+def parse_front_matter(text):
+    """
+    Split `key: value` front matter between --- lines from the markdown body.
+    List values may be written as [a, b] or a, b.
+    """
+    lines = text.split('\n')
+    meta = {}
+    if lines and lines[0].strip() == FRONT_MATTER_DELIMITER:
+        for end, line in enumerate(lines[1:], start=1):
+            if line.strip() == FRONT_MATTER_DELIMITER:
+                for entry in lines[1:end]:
+                    key, sep, value = entry.partition(':')
+                    if sep:
+                        meta[key.strip().lower()] = value.strip().strip('"\'')
+                lines = lines[end + 1:]
+                break
+    return meta, '\n'.join(lines).strip()
+
+
+def split_names(value):
+    if isinstance(value, str):
+        value = value.strip().strip('[]').split(',')
+    return [str(name).strip().strip('"\'') for name in value or []]
+
+
+def parse_import_date(value):
+    if isinstance(value, str) and value:
+        try:
+            date = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return datetime.utcnow()
+        # Stored as naive UTC, like datetime.utcnow()
+        return date.astimezone(timezone.utc).replace(tzinfo=None) if date.tzinfo else date
+    return datetime.utcnow()
+
+
+def iter_import_records(path):
+    """
+    Yield one dict per post from a directory of .md files (walked lazily) or
+    a JSONL file, with keys title, content, date, tags and categories.
+    """
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for name in files:
+                if not name.lower().endswith(('.md', '.markdown')):
+                    continue
+                with open(os.path.join(root, name), encoding='utf-8') as f:
+                    meta, body = parse_front_matter(f.read())
+                title = meta.get('title')
+                if not title:
+                    first_line = body.split('\n', 1)[0]
+                    title = first_line.lstrip('# ').strip() if first_line.startswith('#') else os.path.splitext(name)[0]
+                yield {'title': title, 'content': body, 'date': meta.get('date'),
+                       'tags': meta.get('tags'), 'categories': meta.get('categories')}
+    else:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def import_posts(records, user_id, batch_size=500, jobs=1):
+    """
+    Create posts from `records` in batches, one transaction per batch, and
+    return the number imported. Rendering runs in `jobs` processes; only one
+    batch is held in memory at a time. The related-posts index is rebuilt at
+    the end.
+    """
+    records = iter(records)
+    imported = 0
+    try:
+        while True:
+            chunk = list(islice(records, batch_size))
+            if not chunk:
+                break
+            batch = [record for record in chunk if (record.get('content') or '').strip()]
+            if not batch:
+                continue
+            contents = [record['content'].strip() for record in batch]
+            rendered = render_post_contents(contents, jobs=jobs)
+
+            tags = {tag.name: tag for tag in resolve_names(
+                Tag, [name for record in batch for name in split_names(record.get('tags'))])}
+            categories = {category.name: category for category in resolve_names(
+                Category, [name for record in batch for name in split_names(record.get('categories'))])}
+
+            posts = []
+            for record, content, result in zip(batch, contents, rendered):
+                tag_names = dict.fromkeys(name for name in split_names(record.get('tags')) if name)
+                category_names = dict.fromkeys(name for name in split_names(record.get('categories')) if name)
+                post = Post(
+                    title=(record.get('title') or 'Untitled').strip()[:100],
+                    content=content,
+                    date_posted=parse_import_date(record.get('date')),
+                    user_id=user_id,
+                    tags=[tags[name] for name in tag_names],
+                    categories=[categories[name] for name in category_names]
+                )
+                post.updated_at = post.date_posted
+                post.apply_rendered(result)
+                posts.append(post)
+            db.session.add_all(posts)
+            db.session.flush()
+            index_posts([post.id for post in posts])
+            refresh_tag_counts(tag.id for tag in tags.values())
+            db.session.commit()
+            db.session.expunge_all()
+            imported += len(posts)
+    finally:
+        content_changed()
+    if imported:
+        # Cheaper than updating the index post by post for a bulk import
+        rebuild_related_posts()
+    return imported
+
+
+def migrate_db():
+    """Add columns and indexes introduced after the initial schema to an existing database"""
+    inspector = db.inspect(db.engine)
+    if not inspector.has_table(Post.__tablename__):
+        return
+    existing = {}
+    with db.engine.begin() as connection:
+        # Tables added since, e.g. job and related_post
+        db.metadata.create_all(connection, checkfirst=True)
+        for model in (Post, Draft, Tag):
+            existing[model] = {column['name'] for column in inspector.get_columns(model.__tablename__)}
+            for column in model.__table__.columns:
+                if column.name not in existing[model]:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    connection.execute(db.text(
+                        f'ALTER TABLE {model.__tablename__} ADD COLUMN {column.name} {column_type}'
+                    ))
+        if 'updated_at' not in existing[Post]:
+            connection.execute(db.text(f'UPDATE {Post.__tablename__} SET updated_at = date_posted'))
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+    if 'post_count' not in existing[Tag]:
+        refresh_tag_counts()
+        db.session.commit()
+    if (db.session.execute(db.select(related_post.c.post_id).limit(1)).first() is None
+            and db.session.execute(db.select(post_tags.c.post_id).union(
+                db.select(post_categories.c.post_id)).limit(1)).first() is not None):
+        rebuild_related_posts()
+    if search_index_enabled() and not inspector.has_table(SEARCH_TABLE):
+        with db.engine.begin() as connection:
+            connection.execute(db.text(SEARCH_TABLE_DDL))
+        rebuild_search_index()
+    if db.engine.dialect.name == 'sqlite':
+        with db.engine.begin() as connection:
+            connection.execute(db.text('PRAGMA optimize'))
+
+
 def init_db():
-    if not os.path.exists('blog.db'):
-        with app.app_context():
-            db.create_all()
-            print("Database created successfully.")
+    with app.app_context():
+        db.create_all()
+        migrate_db()
+        print("Database is ready.")
+
+
+@app.cli.command('render-posts')
+@click.option('--all', 'render_all', is_flag=True, help='Re-render every post, not only stale ones.')
+@click.option('--batch-size', default=200, show_default=True, help='Posts per commit.')
+@click.option('--jobs', default=1, show_default=True, help='Rendering processes.')
+def render_posts_command(render_all, batch_size, jobs):
+    """Rebuild the stored HTML of posts, e.g. after changing the sanitizer settings."""
+    migrate_db()
+    rendered = 0
+    last_id = 0
+    while True:
+        batch = Post.query.filter(Post.id > last_id).order_by(Post.id).limit(batch_size).all()
+        if not batch:
+            break
+        stale = [post for post in batch if render_all or not post.is_rendered()]
+        for post, result in zip(stale, render_post_contents([post.content for post in stale], jobs=jobs)):
+            post.apply_rendered(result)
+        rendered += len(stale)
+        db.session.commit()
+        last_id = batch[-1].id
+        db.session.expunge_all()
+    click.echo(f'Rendered {rendered} post(s).')
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Repopulate the full-text search index from the posts table."""
+    migrate_db()
+    if not search_index_enabled():
+        click.echo('Full-text search index requires SQLite; search falls back to LIKE queries.')
+        return
+    rebuild_search_index()
+    click.echo(f'Indexed {Post.query.count()} post(s).')
+
+
+@app.cli.command('rebuild-related')
+def rebuild_related_command():
+    """Recompute the related-posts index and the tag counts."""
+    migrate_db()
+    started = time.perf_counter()
+    refresh_tag_counts()
+    rebuild_related_posts()
+    click.echo(f'Rebuilt related posts of {Post.query.count()} post(s) in {time.perf_counter() - started:.2f}s.')
+
+
+@app.cli.command('run-jobs')
+@click.option('--retry-failed', is_flag=True, help='Requeue failed jobs before running.')
+def run_jobs_command(retry_failed):
+    """Run every due background job now and report what is left."""
+    migrate_db()
+    if retry_failed:
+        for job in Job.query.filter_by(status='failed'):
+            if Job.query.filter_by(kind=job.kind, post_id=job.post_id, status='pending').first():
+                db.session.delete(job)
+            else:
+                job.status, job.attempts, job.run_after = 'pending', 0, datetime.utcnow()
+        db.session.commit()
+    ran = run_due_jobs()
+    counts = dict(db.session.query(Job.status, db.func.count()).group_by(Job.status).all())
+    click.echo(f'Ran {ran} job(s); {counts.get("pending", 0)} pending, {counts.get("failed", 0)} failed.')
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress the files under static/ for far-future caching."""
+    manifest = build_assets()
+    click.echo(f'Fingerprinted {len(manifest)} static file(s).')
+
+
+@app.cli.command('hash-password')
+@click.password_option()
+def hash_password_command(password):
+    """Print the hash of a password, to set as FLASK_ADMIN_PASSWORD_HASH."""
+    click.echo(generate_password_hash(password))
+
+
+@app.cli.command('import-posts')
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--author', default=lambda: app.config['ADMIN_USERNAME'], help='Username the posts are attributed to.')
+@click.option('--batch-size', default=500, show_default=True, help='Posts per transaction.')
+@click.option('--jobs', default=os.cpu_count() or 1, show_default=True, help='Rendering processes.')
+def import_posts_command(path, author, batch_size, jobs):
+    """Import a directory of markdown files with front matter, or a JSONL file."""
+    migrate_db()
+    user = User.query.filter_by(username=author).first()
+    if user is None:
+        raise click.ClickException(f'User {author!r} does not exist; log in once or pass --author.')
+    started = time.perf_counter()
+    imported = import_posts(iter_import_records(path), user.id, batch_size=batch_size, jobs=jobs)
+    elapsed = time.perf_counter() - started
+    click.echo(f'Imported {imported} post(s) in {elapsed:.2f}s ({imported / max(elapsed, 1e-9):.0f} posts/sec).')
+
+
+@app.cli.command('export')
+@click.option('--output', default='build', show_default=True, type=click.Path(file_okay=False),
+              help='Directory to write the static site to.')
+@click.option('--jobs', default=os.cpu_count() or 1, show_default=True, help='Rendering processes.')
+@click.option('--full', is_flag=True, help='Ignore the manifest and render every page.')
+def export_command(output, jobs, full):
+    """Render the public pages to a static directory, rewriting only changed pages."""
+    migrate_db()
+    started = time.perf_counter()
+    rendered, removed, unchanged = export_site(output, jobs=jobs, full=full)
+    click.echo(f'Rendered {rendered} page(s), removed {removed}, unchanged {unchanged} '
+               f'in {time.perf_counter() - started:.2f}s.')
+
+
+# Production server: pre-forking gunicorn workers, each warmed up before it
+# accepts connections. `kill -HUP <master>` replaces the workers gracefully.
+WARMUP_MARKDOWN = """# Warmup
+
+Some *text* with a [link](https://example.com) and a table:
+
+| a | b |
+| - | - |
+| 1 | 2 |
+
+```python
+print('warmup')
+```
+"""
+WARMUP_PATHS = ('/', '/feed.atom', '/sitemap.xml')
+
+
+def warmup():
+    """Compile every template, load the markdown extensions, hash the admin password and fill the caches"""
+    started = time.perf_counter()
+    with app.app_context():
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+        markdown_to_html(WARMUP_MARKDOWN)
+        admin_password_hash()
+        category_cache.get()
+        tag_cache.get()
+    # Render the busiest pages once to warm SQLite's page cache and the feed cache
+    client = app.test_client()
+    for path in WARMUP_PATHS:
+        client.get(path, base_url=app.config['WARMUP_BASE_URL'])
+    app.logger.info(f'Worker {os.getpid()} warmed up in {(time.perf_counter() - started) * 1000:.0f}ms')
+
+
+def reset_worker_state():
+    """
+    Drop the connections inherited from the master so each worker opens its
+    own, and the master's metrics so they are not counted once per worker
+    """
+    with app.app_context():
+        db.engine.dispose(close=False)
+    metrics.reset()
+
+
+def serve(bind, workers, threads=1, max_requests=1000, timeout=30):
+    """Run the app under gunicorn with `workers` pre-forked processes"""
+    from gunicorn.app.base import BaseApplication
+
+    with app.app_context():
+        db.create_all()
+        migrate_db()
+        db.engine.dispose()
+    # Hashed once in the master rather than on each worker's first login
+    admin_password_hash()
+    if workers > 1 and os.getenv('DRAFT_FLUSH_INTERVAL') is None:
+        # Autosaves of one editor may reach different workers; write them through
+        app.config['DRAFT_FLUSH_INTERVAL'] = 0
+    if workers > 1 and app.config['METRICS_ENABLED']:
+        # A scrape reaches one worker, which reports the sum of all of them
+        if app.config['METRICS_DIR'] is None:
+            app.config['METRICS_DIR'] = tempfile.mkdtemp(prefix='tinytype-metrics-')
+        os.makedirs(app.config['METRICS_DIR'], exist_ok=True)
+
+    options = {
+        'bind': bind,
+        'workers': workers,
+        'threads': threads,
+        'timeout': timeout,
+        'graceful_timeout': timeout,
+        # Recycle workers after this many requests, staggered so they do not restart together
+        'max_requests': max_requests,
+        'max_requests_jitter': max_requests // 10,
+        # The app is imported once in the master and shared copy-on-write
+        'preload_app': True,
+        'post_fork': lambda server, worker: reset_worker_state(),
+        'post_worker_init': lambda worker: warmup(),
+    }
+
+    class TinyTypeServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    TinyTypeServer().run()
+
+
+@app.cli.command('serve')
+@click.option('--bind', default=lambda: f"{os.getenv('FLASK_HOST', '127.0.0.1')}:{os.getenv('FLASK_PORT', 5000)}",
+              show_default='FLASK_HOST:FLASK_PORT', help='Address to listen on.')
+@click.option('--workers', default=lambda: int(os.getenv('WEB_CONCURRENCY', 2 * (os.cpu_count() or 1) + 1)),
+              show_default='WEB_CONCURRENCY or 2 x CPUs + 1', type=int, help='Worker processes.')
+@click.option('--threads', default=1, show_default=True, help='Threads per worker.')
+@click.option('--max-requests', default=lambda: int(os.getenv('MAX_REQUESTS', 1000)), type=int,
+              show_default='MAX_REQUESTS or 1000', help='Requests before a worker is recycled; 0 disables.')
+@click.option('--timeout', default=30, show_default=True, help='Seconds before a silent worker is restarted.')
+def serve_command(bind, workers, threads, max_requests, timeout):
+    """Serve the blog with a pre-forking multi-process server."""
+    serve(bind, workers, threads=threads, max_requests=max_requests, timeout=timeout)
 
 
 if __name__ == '__main__':
+    create_app()
     init_db()
     debug_mode = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     host = os.getenv('FLASK_HOST', '127.0.0.1')
@@ -556,4 +3260,4 @@ if __name__ == '__main__':
         app.run(host=host, port=port, debug=debug_mode, ssl_context=ssl_context)
     else:
         # For production
-        app.run(host=host, port=port, debug=False)
+        serve(f'{host}:{port}', int(os.getenv('WEB_CONCURRENCY', 2 * (os.cpu_count() or 1) + 1)))
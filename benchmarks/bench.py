@@ -0,0 +1,323 @@
+"""
+Route benchmarks for TinyType.
+
+Seeds an SQLite database with synthetic Markdown posts, then measures the
+public routes twice: in-process through the Flask test client (latency and
+SQL queries per request) and over HTTP with concurrent clients (latency and
+throughput). Results are written as JSON and can be compared against a
+saved baseline:
+
+    python benchmarks/bench.py --posts 2000 --output benchmarks/baseline.json
+    python benchmarks/bench.py --posts 2000 --baseline benchmarks/baseline.json --threshold 0.25
+
+The comparison exits with status 1 when a route's p95 latency grows by more
+than the threshold or it issues more queries per request than the baseline.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = (
+    'flask sqlite markdown template query index cache render static feed search cursor latency '
+    'python request response session worker thread process pool column table migration deploy '
+    'server client browser header cookie token stream buffer parser sanitizer excerpt category '
+    'tag archive sitemap upload image variant draft autosave export import benchmark profile'
+).split()
+LANGUAGES = ('python', 'javascript', 'bash', 'sql')
+TAG_POOL = 200
+CATEGORY_POOL = 20
+
+
+def sentence(rng, low=6, high=16):
+    words = rng.choices(WORDS, k=rng.randint(low, high))
+    return ' '.join(words).capitalize() + '.'
+
+
+def synthetic_post(rng, index):
+    """Markdown with headings, paragraphs, lists, code fences, a table and images"""
+    blocks = []
+    for section in range(rng.randint(2, 5)):
+        blocks.append(f'## {sentence(rng, 2, 5)[:-1]}')
+        blocks.extend(' '.join(sentence(rng) for _ in range(rng.randint(2, 6))) for _ in range(rng.randint(1, 3)))
+        kind = rng.random()
+        if kind < 0.35:
+            language = rng.choice(LANGUAGES)
+            lines = [f'{rng.choice(WORDS)}_{n} = "{rng.choice(WORDS)}"  # {sentence(rng, 2, 4)}'
+                     for n in range(rng.randint(3, 15))]
+            blocks.append(f'```{language}\n' + '\n'.join(lines) + '\n```')
+        elif kind < 0.55:
+            rows = ['| Name | Value | Notes |', '| --- | ---: | --- |']
+            rows.extend(f'| {rng.choice(WORDS)} | {rng.randint(1, 1000)} | {sentence(rng, 2, 5)} |'
+                        for _ in range(rng.randint(2, 8)))
+            blocks.append('\n'.join(rows))
+        elif kind < 0.75:
+            blocks.append('\n'.join(f'- {sentence(rng, 3, 8)} [{rng.choice(WORDS)}](https://example.com/{index}/{n})'
+                                    for n in range(rng.randint(3, 6))))
+        else:
+            blocks.append(f'![{rng.choice(WORDS)}](/static/uploads/{index:06d}-{section}.png)')
+    return '\n\n'.join(blocks)
+
+
+def synthetic_records(count, seed=0):
+    """Yield import records (see app.iter_import_records) for `count` posts"""
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    for index in range(count):
+        yield {
+            'title': sentence(rng, 3, 8)[:-1][:100],
+            'content': synthetic_post(rng, index),
+            'date': (start + timedelta(hours=index * 7)).isoformat(),
+            'tags': [f'tag-{n}' for n in rng.sample(range(TAG_POOL), rng.randint(2, 8))],
+            'categories': [f'category-{n}' for n in rng.sample(range(CATEGORY_POOL), rng.randint(1, 2))],
+        }
+
+
+def seed_database(count, seed=0):
+    """Create the schema and import `count` synthetic posts unless they are already there"""
+    from app import app, db, Post, User, import_posts, migrate_db
+
+    with app.app_context():
+        db.create_all()
+        migrate_db()
+        if Post.query.count() >= count:
+            return
+        user = User.query.filter_by(username='bench').first()
+        if user is None:
+            user = User(username='bench', password='!')
+            db.session.add(user)
+            db.session.commit()
+        import_posts(synthetic_records(count, seed), user.id)
+
+
+def benchmark_routes(seed=0):
+    """Name -> function returning the next path to request for that route"""
+    from app import app, db, Post, Category
+
+    with app.app_context():
+        post_ids = [row[0] for row in db.session.query(Post.id)]
+        category_ids = [row[0] for row in db.session.query(Category.id)]
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def pick(values):
+        with lock:
+            return rng.choice(values)
+
+    return {
+        'home': lambda: '/',
+        'post_detail': lambda: f'/post/{pick(post_ids)}',
+        'category': lambda: f'/category/{pick(category_ids)}',
+        'search': lambda: f'/search?query={pick(WORDS)}',
+        'search_phrase': lambda: f'/search?query={pick(WORDS)}+{pick(WORDS)}',
+        'feed': lambda: '/feed.atom',
+        'sitemap': lambda: '/sitemap.xml',
+        'api_posts': lambda: '/api/v1/posts?fields=id,title,tags',
+    }
+
+
+# Text a route's response must contain, so a broken route (e.g. a search
+# that ignores its query) is not silently benchmarked
+ROUTE_CHECKS = {
+    'search': b'<mark>',
+}
+
+
+def check_route(name, response):
+    expected = ROUTE_CHECKS.get(name)
+    if expected is not None and expected not in response.get_data():
+        raise RuntimeError(f'{name}: response to {response.request.path} does not contain {expected!r}')
+
+
+def summarize(latencies, elapsed, queries=None):
+    ordered = sorted(latencies)
+    cuts = statistics.quantiles(ordered, n=100, method='inclusive') if len(ordered) > 1 else ordered * 99
+    summary = {
+        'requests': len(ordered),
+        'p50_ms': round(cuts[49] * 1000, 3),
+        'p95_ms': round(cuts[94] * 1000, 3),
+        'p99_ms': round(cuts[98] * 1000, 3),
+        'throughput_rps': round(len(ordered) / elapsed, 1) if elapsed else None,
+    }
+    if queries is not None:
+        summary['queries_per_request'] = round(queries / len(ordered), 2)
+    return summary
+
+
+class QueryCounter:
+    """Count SQL statements sent through the app's engine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def record(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self.record)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self.record)
+
+
+def measure_client(routes, requests, warmup=5):
+    """Request each route `requests` times in-process and count its queries"""
+    from app import app, db
+
+    results = {}
+    with app.app_context():
+        engine = db.engine
+    client = app.test_client()
+    for name, next_path in routes.items():
+        for _ in range(warmup):
+            check_route(name, client.get(next_path()))
+        latencies = []
+        with QueryCounter(engine) as counter:
+            started = time.perf_counter()
+            for _ in range(requests):
+                path = next_path()
+                before = time.perf_counter()
+                response = client.get(path)
+                latencies.append(time.perf_counter() - before)
+                if response.status_code != 200:
+                    raise RuntimeError(f'{path} returned {response.status_code}')
+            elapsed = time.perf_counter() - started
+        results[name] = summarize(latencies, elapsed, counter.count)
+    return results
+
+
+def measure_http(routes, requests, concurrency, warmup=5):
+    """
+    Serve the app on a local port and hit each route from `concurrency`
+    threads. Routes run one after another, so query counts stay per route.
+    """
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from app import app, db
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    with app.app_context():
+        engine = db.engine
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    def fetch(path):
+        request = urllib.request.Request(base + path, headers={'Accept-Encoding': 'gzip'})
+        before = time.perf_counter()
+        with urllib.request.urlopen(request) as response:  # nosec B310 - local benchmark server
+            response.read()
+        return time.perf_counter() - before
+
+    results = {}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for name, next_path in routes.items():
+                list(executor.map(fetch, [next_path() for _ in range(warmup)]))
+                paths = [next_path() for _ in range(requests)]
+                with QueryCounter(engine) as counter:
+                    started = time.perf_counter()
+                    latencies = list(executor.map(fetch, paths))
+                    elapsed = time.perf_counter() - started
+                results[name] = summarize(latencies, elapsed, counter.count)
+    finally:
+        server.shutdown()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return a list of regressions of `results` against `baseline`"""
+    regressions = []
+    for mode in ('client', 'http'):
+        for name, current in results.get(mode, {}).items():
+            previous = baseline.get(mode, {}).get(name)
+            if not previous:
+                continue
+            if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+                regressions.append(f'{mode} {name}: p95 {previous["p95_ms"]}ms -> {current["p95_ms"]}ms')
+            if current.get('queries_per_request', 0) > previous.get('queries_per_request', float('inf')):
+                regressions.append(f'{mode} {name}: queries/request {previous["queries_per_request"]} -> '
+                                   f'{current["queries_per_request"]}')
+    return regressions
+
+
+def print_table(results):
+    for mode, routes in results.items():
+        if mode == 'meta':
+            continue
+        print(f'\n{mode}')
+        print(f'  {"route":<15}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"req/s":>10}{"queries":>9}')
+        for name, row in routes.items():
+            print(f'  {name:<15}{row["p50_ms"]:>10}{row["p95_ms"]:>10}{row["p99_ms"]:>10}'
+                  f'{row["throughput_rps"] or "":>10}{row.get("queries_per_request", ""):>9}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--posts', type=int, default=1000, help='Synthetic posts to seed.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for content and request paths.')
+    parser.add_argument('--db', help='SQLite file to seed and reuse (default: a temporary file).')
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per route and mode.')
+    parser.add_argument('--concurrency', type=int, default=8, help='HTTP client threads.')
+    parser.add_argument('--routes', help='Comma-separated subset of routes to run.')
+    parser.add_argument('--no-http', action='store_true', help='Skip the HTTP load phase.')
+    parser.add_argument('--output', help='Write results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare against this JSON file and fail on regressions.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative p95 slowdown.')
+    args = parser.parse_args(argv)
+
+    # The app reads its configuration at import time, so point it at the
+    # benchmark database before anything imports it
+    db_path = os.path.abspath(args.db or os.path.join(tempfile.mkdtemp(prefix='tinytype-bench-'), 'bench.db'))
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('FLASK_ENV', 'development')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    sys.path.insert(0, ROOT)
+
+    started = time.perf_counter()
+    seed_database(args.posts, args.seed)
+    print(f'Seeded {args.posts} posts into {db_path} in {time.perf_counter() - started:.1f}s')
+
+    routes = benchmark_routes(args.seed)
+    if args.routes:
+        routes = {name: routes[name] for name in args.routes.split(',')}
+    results = {'meta': {'posts': args.posts, 'requests': args.requests, 'concurrency': args.concurrency,
+                        'python': sys.version.split()[0], 'date': datetime.now().isoformat(timespec='seconds')}}
+    results['client'] = measure_client(routes, args.requests)
+    if not args.no_http:
+        results['http'] = measure_http(routes, args.requests, args.concurrency)
+    print_table(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f'\nWrote {args.output}')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print('\nRegressions:\n  ' + '\n  '.join(regressions))
+            return 1
+        print('\nNo regressions against the baseline.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Microbenchmarks for the markdown renderer.
+
+Compares the reused per-thread pipeline of app.MarkdownRenderer with the
+previous approach of building the Markdown parser, extensions, Cleaner and
+Linker for every document, on short, medium and long inputs:
+
+    python benchmarks/markdown_bench.py --docs 200 --jobs 4
+"""
+import argparse
+import html
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bleach import clean, linkify  # noqa: E402
+from markdown import markdown  # noqa: E402
+from markdown.extensions.codehilite import CodeHiliteExtension  # noqa: E402
+from markdown.extensions.fenced_code import FencedCodeExtension  # noqa: E402
+from markdown.extensions.tables import TableExtension  # noqa: E402
+
+from app import (  # noqa: E402
+    CODEHILITE_CSS_CLASS, MARKDOWN_ALLOWED_ATTRIBUTES, MARKDOWN_ALLOWED_PROTOCOLS, MARKDOWN_ALLOWED_TAGS,
+    markdown_renderer, split_excerpt
+)
+from bench import synthetic_records  # noqa: E402
+
+
+def render_per_call(content):
+    """The pipeline as it was before MarkdownRenderer: everything rebuilt per document"""
+    html_content = markdown(html.escape(content), extensions=[
+        FencedCodeExtension(), TableExtension(), CodeHiliteExtension(css_class=CODEHILITE_CSS_CLASS)
+    ])
+    cleaned = clean(html_content, tags=MARKDOWN_ALLOWED_TAGS, attributes=MARKDOWN_ALLOWED_ATTRIBUTES,
+                    protocols=MARKDOWN_ALLOWED_PROTOCOLS, strip=True)
+    return linkify(cleaned, parse_email=True)
+
+
+def time_per_doc(function, docs, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(docs)
+        best = min(best, time.perf_counter() - started)
+    return best / len(docs) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--docs', type=int, default=200, help='Documents per corpus.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the best is kept.')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Processes for render_many.')
+    args = parser.parse_args(argv)
+
+    posts = [record['content'] for record in synthetic_records(args.docs)]
+    corpora = {
+        'short': [sentence.split('\n\n')[0][:120] for sentence in posts],
+        'excerpt': [split_excerpt(post)[0] for post in posts],
+        'full post': posts,
+    }
+    markdown_renderer.render('warm *up*')
+    print(f'{"corpus":<12}{"per call ms":>14}{"renderer ms":>14}{"speedup":>10}')
+    for name, docs in corpora.items():
+        before = time_per_doc(lambda batch: [render_per_call(doc) for doc in batch], docs, args.repeat)
+        after = time_per_doc(lambda batch: [markdown_renderer.render(doc) for doc in batch], docs, args.repeat)
+        print(f'{name:<12}{before:>14.3f}{after:>14.3f}{before / after:>9.2f}x')
+
+    if args.jobs > 1:
+        serial = time_per_doc(markdown_renderer.render_many, posts, 1)
+        parallel = time_per_doc(lambda batch: markdown_renderer.render_many(batch, jobs=args.jobs), posts, 1)
+        print(f'\nrender_many, full posts: {serial:.3f} ms/doc serial, {parallel:.3f} ms/doc with '
+              f'{args.jobs} processes ({serial / parallel:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
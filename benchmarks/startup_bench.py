@@ -0,0 +1,121 @@
+"""
+Startup benchmarks for TinyType.
+
+Starts fresh interpreters against a seeded SQLite database and times
+`import app`, the first requests of each process, which pay for the lazily
+initialized database and templates, and the first markdown render. Results
+can be saved and compared against a baseline like benchmarks/bench.py:
+
+    python benchmarks/startup_bench.py --runs 10 --output startup.json
+    python benchmarks/startup_bench.py --runs 10 --baseline startup.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench import ROOT, seed_database  # noqa: E402
+
+# Run in each child; prints one JSON object of timings in milliseconds
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import app
+timings = {'import_ms': (time.perf_counter() - started) * 1000}
+client = app.create_app().test_client()
+for name, path in zip(('first_request_ms', 'second_request_ms'), sys.argv[1:]):
+    before = time.perf_counter()
+    response = client.get(path)
+    timings[name] = (time.perf_counter() - before) * 1000
+    if response.status_code != 200:
+        raise SystemExit(f'{path} returned {response.status_code}')
+timings['ready_ms'] = (time.perf_counter() - started) * 1000
+before = time.perf_counter()
+app.markdown_to_html(app.WARMUP_MARKDOWN)
+timings['first_render_ms'] = (time.perf_counter() - before) * 1000
+timings['modules'] = len(sys.modules)
+print(json.dumps(timings))
+"""
+# Pages serve stored HTML, so the markdown renderer is first loaded by the
+# render timed after them, as when a post is first saved
+PATHS = ('/', '/post/1')
+
+
+def measure_startup(runs, paths=PATHS):
+    """Time `runs` fresh processes; returns the list of their timings"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', CHILD, *paths], cwd=ROOT, env=os.environ,
+                                check=True, capture_output=True, text=True).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample['process_ms'] = (time.perf_counter() - started) * 1000
+        samples.append(sample)
+    return samples
+
+
+def summarize(samples):
+    """Median and best of each timing across processes"""
+    return {key: {'median': round(statistics.median(sample[key] for sample in samples), 2),
+                  'min': round(min(sample[key] for sample in samples), 2)}
+            for key in samples[0]}
+
+
+def compare(results, baseline, threshold):
+    """Return a list of timings whose median grew by more than `threshold`"""
+    regressions = []
+    for key, current in results['startup'].items():
+        previous = baseline.get('startup', {}).get(key)
+        if key != 'modules' and previous and current['median'] > previous['median'] * (1 + threshold):
+            regressions.append(f'{key}: median {previous["median"]}ms -> {current["median"]}ms')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10, help='Processes to start; medians are reported.')
+    parser.add_argument('--posts', type=int, default=200, help='Synthetic posts to seed.')
+    parser.add_argument('--db', help='SQLite file to seed and reuse (default: a temporary file).')
+    parser.add_argument('--output', help='Write results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare against this JSON file and fail on regressions.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative slowdown.')
+    args = parser.parse_args(argv)
+
+    db_path = os.path.abspath(args.db or os.path.join(tempfile.mkdtemp(prefix='tinytype-startup-'), 'startup.db'))
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('FLASK_ENV', 'development')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('JOB_WORKERS', '0')
+    sys.path.insert(0, ROOT)
+    seed_database(args.posts)
+
+    results = {'meta': {'runs': args.runs, 'posts': args.posts, 'python': sys.version.split()[0],
+                        'date': datetime.now().isoformat(timespec='seconds')},
+               'startup': summarize(measure_startup(args.runs))}
+    print(f'{"timing":<20}{"median":>10}{"min":>10}')
+    for key, row in results['startup'].items():
+        print(f'{key:<20}{row["median"]:>10}{row["min"]:>10}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f'\nWrote {args.output}')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print('\nRegressions:\n  ' + '\n  '.join(regressions))
+            return 1
+        print('\nNo regressions against the baseline.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
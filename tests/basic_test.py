@@ -1,18 +1,71 @@
+import gzip
+import os
 import pytest
-from app import app, db, Post
+import subprocess
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from flask import g, url_for
+from sqlalchemy import event
+from app import (
+    app, create_app, db, Post, Tag, Category, User, split_excerpt, paginate_posts, category_cache, index_post, unindex_post,
+    export_site, resolve_names, import_posts, iter_import_records, Draft, flush_drafts, discard_draft,
+    content_changed, build_assets, load_asset_manifest, metrics, Job, JOB_HANDLERS, job_handler, enqueue_job,
+    post_changed, run_due_jobs, warmup, feed_caches, markdown_renderer, markdown_to_html,
+    related_post, rebuild_related_posts, update_related_posts, refresh_tag_counts, load_user, session_users,
+    CachedValue
+)
 
 @pytest.fixture
 def client():
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    app.config['WTF_CSRF_ENABLED'] = False
+    create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'test-secret',
+        'JOB_WORKERS': 0,
+    })
 
     with app.test_client() as client:
         with app.app_context():
             db.create_all()
+            content_changed()
             yield client
             db.session.remove()
             db.drop_all()
+            session_users.clear()
+
+@contextmanager
+def assert_max_queries(limit):
+    """Fail if the block issues more than `limit` SQL statements"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert len(statements) <= limit, f'{len(statements)} queries issued:\n' + '\n'.join(statements)
+
+
+def add_listing_posts(count):
+    user = User(username='author', password='x')
+    category = Category(name='news')
+    db.session.add_all([user, category])
+    for i in range(count):
+        post = Post(title=f'Post {i}', content='Body', user=user, categories=[category],
+                    tags=[Tag(name=f'tag{i}a'), Tag(name=f'tag{i}b')])
+        post.render()
+        db.session.add(post)
+        index_post(post)
+    db.session.commit()
+    db.session.expunge_all()
+    return category
+
 
 def test_home_page(client):
     """Test if the home page loads correctly"""
@@ -34,4 +87,752 @@ def test_create_post():
         user_id=1
     )
     assert post.title == 'Test Post'
-    assert post.content == 'Test Content'
\ No newline at end of file
+    assert post.content == 'Test Content'
+
+def test_post_render_stores_html(client):
+    """Test rendered HTML is stored and invalidated by content changes"""
+    post = Post(title='Rendered', content='# Heading', user_id=1)
+    post.render()
+    assert post.is_rendered()
+    assert '<h1>Heading</h1>' in post.html
+
+    post.content = '# Changed'
+    assert not post.is_rendered()
+    assert '<h1>Changed</h1>' in post.html
+
+
+def test_render_posts_command(client):
+    """Test the CLI command fills in missing rendered HTML"""
+    db.session.add(Post(title='Stale', content='**bold**', user_id=1))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['render-posts'])
+    assert 'Rendered 1 post(s).' in result.output
+    assert Post.query.first().is_rendered()
+
+
+def test_split_excerpt_keeps_fences_whole():
+    """Test excerpts are cut at block boundaries, never inside a fence"""
+    fence = '```\n' + 'x = 1\n\n' * 100 + '```'
+    content = 'Intro paragraph.\n\n' + fence + '\n\nTrailing paragraph.'
+    excerpt, truncated = split_excerpt(content)
+    assert excerpt == 'Intro paragraph.'
+    assert truncated
+
+    excerpt, truncated = split_excerpt('Short post.')
+    assert excerpt == 'Short post.'
+    assert not truncated
+
+
+def test_home_keyset_pagination(client):
+    """Test older/newer links walk the listing without skipping posts"""
+    app.config['POSTS_PER_PAGE'] = 2
+    try:
+        for i in range(5):
+            post = Post(title=f'Post {i}', content='Body', user_id=1, date_posted=datetime(2024, 1, 1 + i))
+            post.render()
+            db.session.add(post)
+        db.session.commit()
+
+        seen = []
+        url = '/'
+        while url:
+            with app.test_request_context(url):
+                page = paginate_posts(Post.query)
+            seen.extend(post.title for post in page.posts)
+            url = page.older_url
+        assert seen == [f'Post {i}' for i in range(4, -1, -1)]
+
+        with app.test_request_context(page.newer_url):
+            newer = paginate_posts(Post.query)
+        assert [post.title for post in newer.posts] == ['Post 2', 'Post 1']
+
+        rv = client.get('/')
+        assert b'Older posts' in rv.data
+    finally:
+        app.config['POSTS_PER_PAGE'] = 20
+
+
+def test_search_uses_full_text_index(client):
+    """Test search ranks title matches first and highlights the snippet"""
+    tag = Tag(name='python')
+    body_match = Post(title='Unrelated', content='A note about sqlite internals.', user_id=1,
+                      date_posted=datetime(2024, 2, 1))
+    title_match = Post(title='SQLite tips', content='Use the query planner.', user_id=1,
+                       date_posted=datetime(2024, 1, 1), tags=[tag])
+    for post in (body_match, title_match):
+        post.render()
+        db.session.add(post)
+        index_post(post)
+    db.session.commit()
+
+    rv = client.get('/search?query=sqlite')
+    assert rv.data.index(b'SQLite tips') < rv.data.index(b'Unrelated')
+    assert b'<mark>sqlite</mark>' in rv.data
+
+    rv = client.get('/search?query=python')
+    assert b'SQLite tips' in rv.data and b'Unrelated' not in rv.data
+
+    unindex_post(title_match.id)
+    db.session.delete(title_match)
+    db.session.commit()
+    assert b'SQLite tips' not in client.get('/search?query=python').data
+
+
+@pytest.mark.parametrize('url', ['/', '/category/1', '/search', '/search?query=post'])
+def test_listing_query_count_is_constant(client, url):
+    """Test listing pages load users, tags and categories without N+1 queries"""
+    add_listing_posts(10)
+    # Includes the cached sidebar's category and tag cloud queries, run once per TTL
+    with assert_max_queries(7):
+        rv = client.get(url)
+    assert rv.status_code == 200
+    assert b'Post 9' in rv.data and b'tag9b' in rv.data and b'author' in rv.data
+
+
+def test_sidebar_categories_are_cached(client):
+    """Test the sidebar category list is cached and refreshed on invalidation"""
+    add_listing_posts(3)
+    rv = client.get('/search')
+    assert b'news</a> <span class="text-muted">(3)' in rv.data
+
+    db.session.add(Category(name='later'))
+    db.session.commit()
+    with assert_max_queries(0):
+        assert [category.name for category in category_cache.get()] == ['news']
+
+    category_cache.invalidate()
+    assert [category.name for category in category_cache.get()] == ['later', 'news']
+
+
+def test_cached_value_never_returns_a_cleared_value():
+    """Test get() racing invalidate() returns a loaded value rather than None"""
+    cache = CachedValue(lambda: ('loaded',), 'CATEGORY_CACHE_TTL', 'race')
+    stop = threading.Event()
+
+    def invalidate():
+        while not stop.is_set():
+            cache.invalidate()
+
+    thread = threading.Thread(target=invalidate)
+    thread.start()
+    try:
+        with app.app_context():
+            results = {cache.get() for _ in range(50000)}
+    finally:
+        stop.set()
+        thread.join()
+    assert results == {('loaded',)}
+
+
+def test_conditional_get(client):
+    """Test pages answer revalidation with 304 until a post changes"""
+    add_listing_posts(1)
+    for url in ('/', '/post/1', '/category/1'):
+        rv = client.get(url)
+        assert rv.status_code == 200
+        etag = rv.headers['ETag']
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+        last_modified = rv.headers['Last-Modified']
+        assert client.get(url, headers={'If-Modified-Since': last_modified}).status_code == 304
+
+    post = db.session.get(Post, 1)
+    post.updated_at = datetime(2100, 1, 1)
+    db.session.commit()
+    assert client.get('/post/1', headers={'If-None-Match': etag}).status_code == 200
+    assert client.get('/post/1', headers={'If-Modified-Since': last_modified}).status_code == 200
+
+
+def test_deleting_a_post_moves_last_modified_forward(client):
+    """Test date-only revalidation misses after an older post is deleted"""
+    add_listing_posts(2)
+    db.session.execute(db.update(Post).values(updated_at=datetime(2020, 1, 1)))
+    db.session.commit()
+    sitemap_modified = client.get('/sitemap.xml').headers['Last-Modified']
+    pages = {}
+    for url in ('/', '/category/1', '/feed.atom', '/category/1/feed.atom'):
+        pages[url] = client.get(url).headers['Last-Modified']
+        assert client.get(url, headers={'If-Modified-Since': pages[url]}).status_code == 304
+
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    g.pop('_login_user', None)  # requests share the fixture's app context, which cached the anonymous user
+    assert client.get('/delete/1').status_code == 302 and Post.query.count() == 1
+    client.get('/logout')
+    for url, last_modified in pages.items():
+        rv = client.get(url, headers={'If-Modified-Since': last_modified})
+        assert rv.status_code == 200 and b'Post 0' not in rv.data, url
+    assert client.get('/sitemap.xml').headers['Last-Modified'] != sitemap_modified
+
+
+def test_export_rewrites_only_changed_pages(client, tmp_path):
+    """Test the static export writes every page once and then only what changed"""
+    add_listing_posts(3)
+    rendered, removed, unchanged = export_site(str(tmp_path))
+    # 5 pages, the site and category feeds in both formats, and the sitemap
+    assert (rendered, removed, unchanged) == (10, 0, 0)
+    assert b'Post 2' in (tmp_path / 'index.html').read_bytes()
+    assert (tmp_path / 'post' / '1.html').exists()
+    assert (tmp_path / 'category' / '1.html').exists()
+    assert (tmp_path / 'static' / 'css' / 'style.css').exists()
+    # Every exported page links to the feeds, so they must be files too
+    assert 'href="/feed.atom"' in (tmp_path / 'index.html').read_text()
+    assert '<entry><title>Post 2</title>' in (tmp_path / 'feed.atom').read_text()
+    assert '<item><title>Post 2</title>' in (tmp_path / 'category' / '1' / 'feed.rss').read_text()
+    assert '<loc>http://localhost/post/3</loc>' in (tmp_path / 'sitemap.xml').read_text()
+
+    assert export_site(str(tmp_path)) == (0, 0, 10)
+
+    post = db.session.get(Post, 1)
+    post.content = 'Changed body'
+    post.updated_at = datetime(2100, 1, 1)
+    post.render()
+    db.session.commit()
+    # The post, both listings, the four feeds and the sitemap
+    assert export_site(str(tmp_path)) == (8, 0, 2)
+    assert b'Changed body' in (tmp_path / 'post' / '1.html').read_bytes()
+
+    app.config['SITE_URL'] = 'https://blog.example.com'
+    try:
+        assert export_site(str(tmp_path)) == (5, 0, 5)
+        assert '<loc>https://blog.example.com/post/3</loc>' in (tmp_path / 'sitemap.xml').read_text()
+        assert 'href="https://blog.example.com/post/1"' in (tmp_path / 'feed.atom').read_text()
+    finally:
+        app.config['SITE_URL'] = None
+
+
+def test_resolve_names_batches_lookups(client):
+    """Test tags are resolved with a fixed number of queries and no duplicates"""
+    db.session.add(Tag(name='existing'))
+    db.session.commit()
+
+    names = ['existing', ' new ', 'new', ''] + [f'tag{i}' for i in range(20)]
+    with assert_max_queries(3):
+        tags = resolve_names(Tag, names)
+    assert [tag.name for tag in tags] == ['existing', 'new'] + [f'tag{i}' for i in range(20)]
+    assert all(tag.id for tag in tags)
+    assert resolve_names(Tag, ['new'])[0].id == tags[1].id
+    assert Tag.query.count() == 22
+
+
+def test_import_posts_from_markdown_and_jsonl(client, tmp_path):
+    """Test bulk import reads front matter and JSONL and commits in batches"""
+    (tmp_path / 'posts').mkdir()
+    (tmp_path / 'posts' / 'first.md').write_text(
+        '---\ntitle: First\ndate: 2023-05-01\ntags: [python, flask]\ncategories: dev\n---\n# Hello\n\nBody')
+    (tmp_path / 'posts' / 'untitled.md').write_text('# From heading\n\nText')
+    (tmp_path / 'dump.jsonl').write_text(
+        '{"title": "Json", "content": "JSON body", "tags": ["python"], "categories": "dev, misc",'
+        ' "date": "2023-05-01T10:00:00+02:00"}\n')
+
+    assert import_posts(iter_import_records(str(tmp_path / 'posts')), user_id=1, batch_size=1) == 2
+    assert import_posts(iter_import_records(str(tmp_path / 'dump.jsonl')), user_id=1) == 1
+
+    first = Post.query.filter_by(title='First').one()
+    assert first.date_posted == datetime(2023, 5, 1)
+    assert Post.query.filter_by(title='Json').one().date_posted == datetime(2023, 5, 1, 8)
+    assert sorted(tag.name for tag in first.tags) == ['flask', 'python']
+    assert first.is_rendered()
+    assert Post.query.filter_by(title='From heading').count() == 1
+    assert Tag.query.count() == 2 and Category.query.count() == 2
+    assert b'Json' in client.get('/search?query=json').data
+
+
+def test_sqlite_connection_setup_and_indexes(client):
+    """Test connections get the tuned pragmas and lookups have indexes"""
+    with db.engine.connect() as connection:
+        assert connection.exec_driver_sql('PRAGMA synchronous').scalar() == 1  # NORMAL
+        assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == app.config['SQLITE_PRAGMAS']['busy_timeout']
+
+    # sqlite_master rather than the inspector: schema PRAGMAs on a pooled
+    # connection can report the schema from before the fixture recreated it
+    indexed = set(db.session.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+    assert {'ix_post_date_posted_id', 'ix_post_user_id', 'ix_draft_user_id',
+            'ix_post_tags_tag_id', 'ix_post_categories_category_id'} <= indexed
+
+
+def test_upload_image_dedupes_and_resizes(client, tmp_path, monkeypatch):
+    """Test uploads are stored by content hash with resized variants"""
+    from io import BytesIO
+    from PIL import Image
+    import app as app_module
+
+    monkeypatch.setattr(app_module, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.config, 'UPLOAD_VARIANT_WORKERS', 0)
+    user = User(username='admin', password='x')
+    db.session.add(user)
+    db.session.commit()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+
+    buffer = BytesIO()
+    Image.new('RGB', (800, 400), 'red').save(buffer, format='PNG')
+    data = buffer.getvalue()
+
+    first = client.post('/upload-image', data={'image': (BytesIO(data), 'a.png')}).get_json()
+    second = client.post('/upload-image', data={'image': (BytesIO(data), 'b.png')}).get_json()
+    assert first['url'] == second['url']
+    assert first['content_url'] == first['url']  # no variant wider than the original
+    assert first['thumbnail_url'].endswith('-320.png')
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        [first['url'].rsplit('/', 1)[1], first['thumbnail_url'].rsplit('/', 1)[1],
+         first['thumbnail_url'].rsplit('/', 1)[1].replace('.png', '.webp')])
+
+    rv = client.post('/upload-image', data={'image': (BytesIO(b'not an image'), 'c.png')})
+    assert rv.status_code == 400
+
+
+def test_upload_content_copy_is_written_before_the_response(client, tmp_path, monkeypatch):
+    """Test the inserted image exists at once, a failed WebP save blocks nothing and bad data leaves no file"""
+    from io import BytesIO
+    from PIL import Image
+    import app as app_module
+
+    monkeypatch.setattr(app_module, 'UPLOAD_FOLDER', str(tmp_path))
+    scheduled = []
+    monkeypatch.setattr(app_module, 'schedule_image_variants', lambda *args: scheduled.append(args))
+
+    def no_webp(*args):
+        raise OSError('WebP support not built')
+    monkeypatch.setitem(Image.SAVE, 'WEBP', no_webp)
+    user = User(username='admin', password='x')
+    db.session.add(user)
+    db.session.commit()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+
+    buffer = BytesIO()
+    Image.new('RGB', (1600, 400), 'red').save(buffer, format='PNG')
+    data = client.post('/upload-image', data={'image': (BytesIO(buffer.getvalue()), 'a.png')}).get_json()
+    assert data['content_url'].endswith('-1200.png')
+    assert (tmp_path / data['content_url'].rsplit('/', 1)[1]).exists()
+    assert data['thumbnail_url'] == data['url']  # the 320 copy is still queued
+    assert '-320' not in data['srcset'] and data['webp_srcset'] == ''
+    assert scheduled
+
+    stem = data['url'].rsplit('/', 1)[1].rsplit('.', 1)[0]
+    assert app_module.generate_image_variants(str(tmp_path), f'{stem}.png', (320,)) == [
+        f'{stem}-320.webp: WebP support not built']
+    assert (tmp_path / f'{stem}-320.png').exists()
+
+    before = set(tmp_path.iterdir())
+    junk = b'\x89PNG\r\n\x1a\n' + b'junk' * 100
+    rv = client.post('/upload-image', data={'image': (BytesIO(junk), 'b.png')})
+    assert rv.status_code == 400
+    assert set(tmp_path.iterdir()) == before
+
+
+def test_save_draft_applies_deltas_and_coalesces(client, monkeypatch):
+    """Test autosave applies content deltas, skips no-ops and detects conflicts"""
+    monkeypatch.setitem(app.config, 'DRAFT_FLUSH_INTERVAL', 3600)
+    user = User(username='writer', password='x')
+    db.session.add(user)
+    db.session.commit()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+
+    rv = client.post('/save-draft', json={'title': 'Draft', 'content': 'Hello world', 'tags': [], 'categories': ''})
+    assert rv.get_json()['version'] == 1
+    assert Draft.query.one().content == 'Hello world'  # first save is written at once
+
+    rv = client.post('/save-draft', json={'version': 1, 'content_delta': {'start': 6, 'end': 11, 'text': 'there'}})
+    assert rv.get_json()['version'] == 2
+    assert rv.headers['ETag'] == '"2"'
+    db.session.expire_all()
+    assert Draft.query.one().version == 1  # coalesced in memory until the next flush
+
+    assert client.post('/save-draft', json={'version': 2, 'title': 'Draft'}).get_json()['version'] == 2
+    assert client.get('/load-draft').get_json()['draft']['content'] == 'Hello there'
+
+    rv = client.post('/save-draft', json={'version': 1, 'title': 'Stale'})
+    assert rv.status_code == 409
+
+    for body in ({'version': 'abc'}, {'version': 2, 'content_delta': {'start': 0, 'end': 0, 'text': 5}},
+                 {'version': 2, 'content_delta': 'oops'}, ['not', 'an', 'object']):
+        assert client.post('/save-draft', json=body).status_code == 400
+    assert client.post('/save-draft', data='x', content_type='text/plain').status_code == 400
+    assert client.post('/save-draft', json={'title': 'X'}, headers={'If-Match': '"abc"'}).status_code == 400
+    assert rv.get_json()['draft']['content'] == 'Hello there'
+
+    flush_drafts(force=True)
+    db.session.expire_all()
+    assert (Draft.query.one().content, Draft.query.one().version) == ('Hello there', 2)
+    discard_draft(user.id)
+
+
+def test_concurrent_draft_flushes_write_one_row(client, monkeypatch):
+    """Test the flusher thread and a request flushing the same user do not both insert a draft"""
+    monkeypatch.setitem(app.config, 'DRAFT_FLUSH_INTERVAL', 3600)
+    user = User(username='writer', password='x')
+    db.session.add(user)
+    db.session.commit()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+    client.post('/save-draft', json={'title': 'Draft', 'content': 'One', 'tags': [], 'categories': ''})
+    db.session.execute(db.delete(Draft))
+    db.session.commit()
+    client.post('/save-draft', json={'version': 1, 'content': 'Two'})
+
+    # Hold each flush between its lookup and its insert until both have looked
+    # up; serialized flushes time out here and the second one finds the row
+    barrier = threading.Barrier(2, timeout=0.5)
+
+    def pause_after_lookup(conn, cursor, statement, *args):
+        if statement.startswith('SELECT') and 'FROM draft' in statement:
+            try:
+                barrier.wait()
+            except threading.BrokenBarrierError:
+                pass
+
+    def flush():
+        with app.app_context():
+            flush_drafts(force=True)
+
+    event.listen(db.engine, 'after_cursor_execute', pause_after_lookup)
+    try:
+        threads = [threading.Thread(target=flush) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        event.remove(db.engine, 'after_cursor_execute', pause_after_lookup)
+    assert [draft.content for draft in Draft.query.all()] == ['Two']
+    discard_draft(user.id)
+
+
+def test_feeds_and_sitemap(client):
+    """Test feeds are served from cache with validators until content changes"""
+    add_listing_posts(2)
+    rv = client.get('/feed.atom')
+    assert rv.mimetype == 'application/atom+xml'
+    assert b'<title>Post 1</title>' in rv.data and b'&lt;p&gt;Body&lt;/p&gt;' in rv.data
+    assert client.get('/feed.atom', headers={'If-None-Match': rv.headers['ETag']}).status_code == 304
+    assert b'<item><title>Post 0</title>' in client.get('/category/1/feed.rss').data
+
+    db.session.add(Post(title='Uncached', content='New', user_id=1))
+    db.session.commit()
+    assert b'Uncached' not in client.get('/feed.atom').data
+    content_changed()
+    assert b'Uncached' in client.get('/feed.atom').data
+
+    rv = client.get('/sitemap.xml')
+    assert b'<loc>http://localhost/post/3</loc>' in rv.data
+    assert b'<loc>http://localhost/category/1</loc>' in rv.data
+    assert client.get('/sitemap.xml', headers={'If-None-Match': rv.headers['ETag']}).status_code == 304
+
+
+
+def test_feed_cache_is_bounded(client, monkeypatch):
+    """Test missing categories and spoofed hosts do not grow the feed cache without limit"""
+    add_listing_posts(1)
+    feed_caches.clear()
+    for category_id in range(2, 52):
+        assert client.get(f'/category/{category_id}/feed.atom').status_code == 404
+    assert not feed_caches
+
+    monkeypatch.setitem(app.config, 'SITE_URL', 'https://blog.example.com/')
+    for host in ('a.example', 'b.example', 'c.example'):
+        rv = client.get('/feed.atom', headers={'Host': host})
+        assert b'<link href="https://blog.example.com/post/1"/>' in rv.data and host.encode() not in rv.data
+    assert list(feed_caches) == [('atom', None, 'https://blog.example.com')]
+
+    monkeypatch.setitem(app.config, 'SITE_URL', None)
+    monkeypatch.setitem(app.config, 'FEED_CACHE_ENTRIES', 5)
+    for n in range(20):
+        client.get('/feed.rss', headers={'Host': f'host{n}.example'})
+    assert len(feed_caches) == 5 and ('rss', None, 'http://host19.example') in feed_caches
+
+
+def test_api_posts_fields_pagination_and_streaming(client):
+    """Test the JSON API selects fields, pages with cursors and streams exports"""
+    add_listing_posts(3)
+    app.config['POSTS_PER_PAGE'] = 2
+    try:
+        body = client.get('/api/v1/posts?fields=id,title,tags').get_json()
+    finally:
+        app.config['POSTS_PER_PAGE'] = 20
+    assert body['posts'] == [{'id': 3, 'title': 'Post 2', 'tags': ['tag2a', 'tag2b']},
+                             {'id': 2, 'title': 'Post 1', 'tags': ['tag1a', 'tag1b']}]
+    older = client.get(body['links']['older']).get_json()
+    assert [post['title'] for post in older['posts']] == ['Post 0']
+
+    post = client.get('/api/v1/posts/1?html=1').get_json()
+    assert post['content'] == 'Body' and post['content_html'] == '<p>Body</p>'
+    assert post['author'] == 'author' and post['categories'] == ['news']
+    assert client.get('/api/v1/posts/99').status_code == 404
+    assert client.get('/api/v1/posts?fields=password').status_code == 400
+
+    streamed = client.get('/api/v1/posts?stream=1&fields=id').get_json()
+    assert streamed == {'posts': [{'id': 3}, {'id': 2}, {'id': 1}]}
+    assert client.get('/api/v1/categories').get_json() == {'categories': [{'id': 1, 'name': 'news', 'post_count': 3}]}
+    assert len(client.get('/api/v1/tags').get_json()['tags']) == 6
+
+
+def test_api_html_is_rendered_while_the_render_job_is_pending(client):
+    """Test the API never returns missing or stale HTML for a post awaiting its render job"""
+    add_listing_posts(1)
+    post = db.session.get(Post, 1)
+    post.content = 'Edited *body*'
+    db.session.add(Post(title='New', content='Fresh', user_id=1))
+    db.session.commit()
+
+    edited = client.get('/api/v1/posts/1?html=1').get_json()
+    assert edited['content_html'] == '<p>Edited <em>body</em></p>'
+    listed = {post['title']: post['excerpt_html'] for post in client.get('/api/v1/posts').get_json()['posts']}
+    assert listed == {'Post 0': '<p>Edited <em>body</em></p>', 'New': '<p>Fresh</p>'}
+
+    # Once rendered, list calls read neither the content nor its hash
+    for post in Post.query:
+        post.render()
+    db.session.commit()
+    with assert_max_queries(10) as statements:
+        listed = client.get('/api/v1/posts').get_json()['posts']
+    assert [post['excerpt_html'] for post in listed] == ['<p>Fresh</p>', '<p>Edited <em>body</em></p>']
+    assert not any('post.content,' in statement or 'post.content AS' in statement or 'content_hash' in statement
+                   for statement in statements)
+
+
+def test_compression_and_fingerprinted_static_assets(client, tmp_path, monkeypatch):
+    """Test responses are gzip-encoded and built static assets get hashed, immutable URLs"""
+    add_listing_posts(3)
+    rv = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert rv.headers['Content-Encoding'] == 'gzip' and 'Accept-Encoding' in rv.headers['Vary']
+    assert b'Post 2' in gzip.decompress(rv.data)
+    assert client.get('/', headers={'If-None-Match': rv.headers['ETag']}).status_code == 304
+    assert 'Content-Encoding' not in client.get('/').headers
+
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'style.css').write_text('body { color: red; }' * 10)
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path))
+    try:
+        manifest = build_assets()
+        hashed = manifest['css/style.css']
+        assert hashed.startswith('css/style.') and (tmp_path / (hashed + '.gz')).exists()
+        with app.test_request_context():
+            assert url_for('static', filename='css/style.css') == '/static/' + hashed
+        rv = client.get('/static/' + hashed, headers={'Accept-Encoding': 'gzip'})
+        assert rv.headers['Content-Encoding'] == 'gzip' and rv.mimetype == 'text/css'
+        assert 'immutable' in rv.headers['Cache-Control']
+        assert gzip.decompress(rv.data).startswith(b'body { color: red; }')
+        rv.close()
+
+        builds = [hashed]
+        for color in ('green', 'blue', 'black'):
+            (tmp_path / 'css' / 'style.css').write_text(f'body {{ color: {color}; }}' * 10)
+            builds.append(build_assets()['css/style.css'])
+        assert all(name.count('.') == 2 for name in builds) and len(set(builds)) == 4
+        # Only the latest two builds' copies are left
+        suffixes = ('', '.gz', '.br') if (tmp_path / (builds[-1] + '.br')).exists() else ('', '.gz')
+        files = sorted(path.name for path in (tmp_path / 'css').iterdir())
+        assert files == sorted(['style.css'] + [name.split('/')[1] + suffix for name in builds[2:] for suffix in suffixes])
+    finally:
+        monkeypatch.undo()
+        load_asset_manifest()
+
+
+def test_benchmark_content_and_regression_check(client):
+    """Test synthetic benchmark posts import cleanly and slowdowns are reported"""
+    from benchmarks.bench import benchmark_routes, check_route, compare, synthetic_records
+    user = User(username='bench', password='x')
+    db.session.add(user)
+    db.session.commit()
+    assert import_posts(synthetic_records(5), user.id) == 5
+    post = Post.query.first()
+    assert '<h2>' in post.html and len(post.tags) >= 2 and post.categories
+
+    routes = benchmark_routes()
+    check_route('search', client.get(routes['search']()))
+    with pytest.raises(RuntimeError):
+        check_route('search', client.get('/search?q=flask'))
+
+    baseline = {'client': {'home': {'p95_ms': 10.0, 'queries_per_request': 4}}}
+    assert compare({'client': {'home': {'p95_ms': 11.0, 'queries_per_request': 4}}}, baseline, 0.2) == []
+    regressions = compare({'client': {'home': {'p95_ms': 13.0, 'queries_per_request': 5}}}, baseline, 0.2)
+    assert len(regressions) == 2
+
+
+def test_metrics_endpoint_and_slow_request_log(client, caplog):
+    """Test /metrics is opt-in and token-protected and records latency, SQL and cache series"""
+    assert client.get('/metrics').status_code == 404
+    add_listing_posts(2)
+    app.config.update(METRICS_ENABLED=True, METRICS_TOKEN='secret', SLOW_REQUEST_MS=0)
+    metrics.reset()
+    try:
+        client.get('/')
+        client.get('/post/1')
+        assert client.get('/metrics').status_code == 401
+        rv = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    finally:
+        app.config.update(METRICS_ENABLED=False, METRICS_TOKEN=None, SLOW_REQUEST_MS=500)
+    body = rv.get_data(as_text=True)
+    assert rv.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    assert 'tinytype_request_duration_seconds_count{endpoint="home"} 1' in body
+    assert 'tinytype_sql_statements_total{endpoint="post_detail"}' in body
+    assert 'tinytype_template_render_seconds_bucket{template="home.html",le="+Inf"} 1' in body
+    assert 'tinytype_cache_requests_total{cache="markdown",result="hit"}' in body
+    assert 'Slow request: GET /post/1 (post_detail)' in caplog.text and 'SELECT' in caplog.text
+
+
+def test_metrics_are_summed_across_worker_processes(client, tmp_path):
+    """Test /metrics reports every worker's series, keeping those of exited workers"""
+    app.config.update(METRICS_ENABLED=True, METRICS_TOKEN='secret', METRICS_DIR=str(tmp_path))
+    metrics.reset()
+    try:
+        client.get('/login')
+        pid = os.fork()
+        if pid == 0:  # a second worker that serves two requests and exits
+            metrics.reset()
+            metrics.increment('tinytype_requests_total', 2, endpoint='login', status=200)
+            metrics.observe('tinytype_request_duration_seconds', 0.002, endpoint='login')
+            metrics.save(str(tmp_path))
+            os._exit(0)
+        os.waitpid(pid, 0)
+        for _ in range(2):
+            body = client.get('/metrics', headers={'Authorization': 'Bearer secret'}).get_data(as_text=True)
+            assert 'tinytype_requests_total{endpoint="login",status="200"} 3' in body
+            assert 'tinytype_request_duration_seconds_count{endpoint="login"} 2' in body
+        # The exited worker's file was folded into the archive
+        assert {path.name.split('-')[1] for path in tmp_path.glob('metrics-*.json')} == {
+            'archive.json', str(os.getpid())}
+    finally:
+        app.config.update(METRICS_ENABLED=False, METRICS_TOKEN=None, METRICS_DIR=None)
+
+
+def test_background_jobs_dedupe_retry_and_fail(client):
+    """Test post jobs are queued once per post, retried after errors and marked failed at the limit"""
+    add_listing_posts(1)
+    post = db.session.get(Post, 1)
+    post.content = 'Edited *body*'
+    post_changed(1)
+    post_changed(1)
+    db.session.commit()
+    assert sorted(job.kind for job in Job.query) == ['index_post', 'relate_post', 'render_post']
+
+    calls = []
+
+    @job_handler('flaky')
+    def flaky(post_id):
+        calls.append(post_id)
+        if len(calls) < 3:
+            raise RuntimeError('boom')
+
+    app.config.update(JOB_RETRY_DELAY=0, JOB_MAX_ATTEMPTS=3)
+    try:
+        enqueue_job('flaky', 1)
+        db.session.commit()
+        assert run_due_jobs() == 6
+        assert calls == [1, 1, 1] and Job.query.count() == 0
+        assert db.session.get(Post, 1).content_html == '<p>Edited <em>body</em></p>'
+
+        JOB_HANDLERS['flaky'] = lambda post_id: 1 / 0
+        enqueue_job('flaky', 1)
+        db.session.commit()
+        run_due_jobs()
+        job = Job.query.one()
+        assert job.status == 'failed' and job.attempts == 3 and 'ZeroDivisionError' in job.last_error
+    finally:
+        app.config.update(JOB_RETRY_DELAY=5, JOB_MAX_ATTEMPTS=5)
+        JOB_HANDLERS.pop('flaky')
+
+
+def test_worker_warmup_compiles_templates_and_fills_caches(client):
+    """Test a server worker's warmup compiles every template and fills the sidebar and feed caches"""
+    add_listing_posts(2)
+    content_changed()
+    warmup()
+    assert {key[1] for key in app.jinja_env.cache.keys()} >= {'edit_post.html', 'search.html', 'home.html'}
+    assert category_cache._entry is not None and feed_caches[('atom', None, 'https://localhost')]._entry is not None
+
+
+def test_markdown_renderer_threads_and_batches_match_serial_output():
+    """Test the shared renderer gives the same HTML from several threads and from render_many"""
+    from concurrent.futures import ThreadPoolExecutor
+    docs = [f'# Doc {i}\n\n```python\nx = {i}\n```\n\n| a | b |\n| - | - |\n| {i} | <b> |\n\nhttp://example.com/{i}'
+            for i in range(12)]
+    expected = [markdown_renderer.render(doc) for doc in docs]
+    assert '<table>' in expected[0] and 'href="http://example.com/0"' in expected[0] and '&lt;b&gt;' in expected[0]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(executor.map(markdown_renderer.render, docs * 4)) == expected * 4
+    assert markdown_renderer.render_many(docs) == expected
+    assert markdown_renderer.render_many(docs, jobs=2) == expected
+    assert markdown_to_html('') == '' and str(markdown_to_html(docs[3])) == expected[3]
+
+
+def test_related_posts_index_updates_incrementally_like_a_rebuild(client):
+    """Test incremental related-post updates match a full rebuild, and pages show related posts and tag counts"""
+    import random
+    rng = random.Random(7)
+    user = User(username='author', password='x')
+    tags = [Tag(name=f't{i}') for i in range(8)]
+    categories = [Category(name=f'c{i}') for i in range(3)]
+    db.session.add_all([user, *tags, *categories])
+    for i in range(30):
+        db.session.add(Post(title=f'Post {i}', content='Body', user=user, tags=rng.sample(tags, rng.randint(0, 3)),
+                            categories=rng.sample(categories, rng.randint(0, 1))))
+    db.session.commit()
+    rebuild_related_posts()
+
+    def snapshot():
+        return sorted(db.session.execute(db.select(related_post)).all())
+
+    for step in range(25):
+        post = db.session.get(Post, rng.choice(db.session.execute(db.select(Post.id)).scalars().all()))
+        if step > 20:
+            db.session.delete(post)
+        else:
+            post.tags = rng.sample(tags, rng.randint(0, 3))
+        db.session.flush()
+        update_related_posts(post.id)
+        db.session.commit()
+        incremental = snapshot()
+        rebuild_related_posts()
+        assert incremental == snapshot()
+
+    refresh_tag_counts()
+    db.session.commit()
+    post_id, related_id = db.session.execute(db.select(related_post.c.post_id, related_post.c.related_id)).first()
+    rv = client.get(f'/post/{post_id}')
+    assert b'Related posts' in rv.data and f'/post/{related_id}"'.encode() in rv.data
+    top = max(tags, key=lambda tag: (tag.post_count, tag.name))
+    assert f'title="{top.post_count} posts">{top.name}</a>'.encode() in rv.data
+    assert 'class="tag-level-5"' in rv.get_data(as_text=True)
+
+
+def test_lazy_startup_admin_hash_and_cached_session_user(client):
+    """Test importing the app defers heavy setup and logged-in requests do not reload the user"""
+    from werkzeug.security import generate_password_hash
+    probe = ("import sys, app; print(app.app.config['ADMIN_PASSWORD_HASH'], 'sqlalchemy' in app.app.extensions, "
+             "[name for name in ('markdown', 'bleach', 'pygments', 'flask_talisman') if name in sys.modules])")
+    env = {key: value for key, value in os.environ.items() if not key.startswith('FLASK_ADMIN')}
+    output = subprocess.run([sys.executable, '-c', probe], cwd=os.path.dirname(os.path.dirname(__file__)),
+                            env=env, check=True, capture_output=True, text=True).stdout
+    assert output.split() == ['None', 'False', '[]']
+    # Talisman is set up by create_app(), before the first request
+    rv = client.get('/login')
+    assert 'Permissions-Policy' in rv.headers and rv.headers['Referrer-Policy'] == 'strict-origin-when-cross-origin'
+
+    app.config.update(ADMIN_USERNAME='admin', ADMIN_PASSWORD_HASH=generate_password_hash('s3cret'))
+    try:
+        assert client.post('/login', data={'username': 'admin', 'password': 'nope'}).status_code == 200
+        assert client.post('/login', data={'username': 'admin', 'password': 's3cret'}).status_code == 302
+    finally:
+        app.config.update(ADMIN_USERNAME=None, ADMIN_PASSWORD_HASH=None)
+    user_id = str(User.query.filter_by(username='admin').one().id)
+    load_user(user_id)
+    with assert_max_queries(0):
+        assert load_user(user_id).username == 'admin' and load_user(user_id).is_authenticated
+    assert client.get('/new').status_code == 200
+    client.get('/logout')
+    assert client.get('/new').status_code == 302
+
+
+def test_post_etag_changes_when_related_posts_are_filled_in(client):
+    """Test a page fetched before the relate_post job ran is not revalidated after it"""
+    add_listing_posts(2)
+    rv = client.get('/post/1')
+    assert b'Related posts' not in rv.data
+    rebuild_related_posts()
+    db.session.commit()
+    rv = client.get('/post/1', headers={'If-None-Match': rv.headers['ETag']})
+    assert rv.status_code == 200 and b'Related posts' in rv.data